@@ -0,0 +1,79 @@
+"""
+Exercise the FloClient circuit breaker against the local Flo cloud simulator.
+
+Runs device refresh cycles through a healthy period, an outage and a recovery, and
+reports how many requests reached the (failing) service and how long each cycle
+took, with and without the circuit breaker, e.g.:
+
+    python benchmarks/bench_breaker.py --devices 10 --cycles 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from custom_components.flo.breaker import CircuitBreaker  # noqa: E402
+from custom_components.flo.client import FloClient  # noqa: E402
+from custom_components.flo.coordinator import async_refresh  # noqa: E402
+from simulator import SimulatedFloCloud  # noqa: E402
+
+
+async def async_run(cloud, use_breaker, cycles, base_backoff):
+    flo = FloClient('sim@example.com', 'password', **cloud.client_kwargs())
+    breaker = CircuitBreaker(base_backoff=base_backoff)
+    if not use_breaker:
+        breaker = CircuitBreaker(failure_threshold=float('inf'))
+    flo.breaker = breaker
+
+    cache = {}
+    rows = []
+    try:
+        await async_refresh(flo, cache)
+
+        for phase, outage in (('outage', True), ('recovery', False)):
+            cloud.outage = outage
+            for cycle in range(cycles):
+                before = cloud.request_count
+                start = time.perf_counter()
+                try:
+                    failed = len(await async_refresh(flo, cache))
+                except Exception:  # pylint: disable=broad-except
+                    failed = len(cloud.devices)
+                rows.append((phase, cycle, cloud.request_count - before, failed,
+                             time.perf_counter() - start, flo.breaker.state))
+                await asyncio.sleep(base_backoff / 2)
+    finally:
+        await flo.async_close()
+    return rows
+
+
+async def async_benchmark(args):
+    for use_breaker in (False, True):
+        cloud = SimulatedFloCloud(args.devices, args.locations, args.latency)
+        await cloud.async_start()
+        try:
+            rows = await async_run(cloud, use_breaker, args.cycles, args.backoff)
+        finally:
+            await cloud.async_stop()
+
+        print(f"\ncircuit breaker {'enabled' if use_breaker else 'disabled'}")
+        print(f"{'phase':>9} {'cycle':>6} {'requests':>9} {'failed':>7} {'cycle (s)':>10} {'circuit':>10}")
+        for phase, cycle, requests, failed, elapsed, state in rows:
+            print(f"{phase:>9} {cycle:>6} {requests:>9} {failed:>7} {elapsed:>10.3f} {state:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--locations', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per response')
+    parser.add_argument('--cycles', type=int, default=6, help='refresh cycles per phase')
+    parser.add_argument('--backoff', type=float, default=1.0, help='base circuit breaker backoff (s)')
+    asyncio.run(async_benchmark(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
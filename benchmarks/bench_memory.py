@@ -0,0 +1,230 @@
+"""
+Benchmark the memory held per Flo device by the cache: complete JSON payloads
+(as previously cached) vs the compact DeviceSnapshot projections, e.g.:
+
+    python benchmarks/bench_memory.py --devices 1 10 100 1000
+"""
+import argparse
+import copy
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from custom_components.flo.model import DeviceSnapshot  # noqa: E402
+
+# representative (abridged) Flo v2 device payload
+DEVICE_PAYLOAD = {
+    'isConnected': True,
+    'fwVersion': '6.1.1',
+    'lastHeardFromTime': '2020-08-14T19:37:04.000Z',
+    'fwProperties': {
+        'alarm_away_high_flow_rate_shut_off_enabled': True,
+        'alarm_away_high_water_use_shut_off_enabled': True,
+        'alarm_away_long_flow_event_shut_off_enabled': True,
+        'alarm_away_v2_shutoff_enabled': True,
+        'alarm_shutoff_id': '',
+        'alarm_shutoff_time_epoch_sec': -1,
+        'alarm_snooze_enabled': True,
+        'alarm_suppress_duplicate_duration': 300,
+        'alarm_suppress_until_event_end': False,
+        'data_flosense_force_retrain': 1,
+        'data_flosense_min_flodetect_sec': 0,
+        'data_flosense_min_irr_sec': 180,
+        'data_flosense_status_interval': 1200,
+        'data_flosense_verbosity': 1,
+        'device_data_free_mb': 1465,
+        'device_installed': True,
+        'device_mem_available_kb': 339456,
+        'device_rootfs_free_kb': 1004,
+        'device_uptime_sec': 3345821,
+        'flodetect_post_enabled': True,
+        'flodetect_post_frequency': 0,
+        'flodetect_storage_days': 60,
+        'flosense_action': '',
+        'flosense_deployment_result': 'success',
+        'flosense_link': '',
+        'flosense_shut_off_level': 2,
+        'flosense_state': 'active',
+        'flosense_version_app': '2.5.12',
+        'flosense_version_model': '2.5.0',
+        'fw_ver': '6.1.1',
+        'fw_ver_a': '6.1.1',
+        'fw_ver_b': '6.0.24',
+        'heartbeat_frequency': 1800,
+        'ht_attempt_interval': 60000,
+        'ht_check_window_max_pressure_decay_limit': 0.1,
+        'ht_check_window_width': 180000,
+        'ht_controller': 'ultima',
+        'ht_max_open_closed_pressure_decay_pct_limit': 2,
+        'ht_max_pressure_growth_limit': 3,
+        'ht_max_pressure_growth_pct_limit': 3,
+        'ht_max_valve_closures_per_24h': 0,
+        'ht_min_computable_point_limit': 3,
+        'ht_min_pressure_limit': 10,
+        'ht_min_r_squared_limit': 0.9,
+        'ht_min_slope_limit': -0.6,
+        'ht_phase_1_max_pressure_decay_limit': 6,
+        'ht_phase_1_time_index': 12000,
+        'ht_phase_2_max_pressure_decay_limit': 6,
+        'ht_phase_2_time_index': 30000,
+        'ht_phase_3_max_pressure_decay_limit': 3,
+        'ht_phase_3_time_index': 240000,
+        'ht_phase_4_max_pressure_decay_limit': 1.5,
+        'ht_phase_4_time_index': 480000,
+        'ht_pre_delay': 0,
+        'ht_recent_flow_event_cool_down': 1000,
+        'ht_scheduler_end': '08:00',
+        'ht_scheduler_start': '06:00',
+        'ht_scheduler_ultima': '03:00',
+        'ht_times_per_day': 1,
+        'log_bytes_sent': 176255,
+        'log_enabled': True,
+        'log_frequency': 3600,
+        'log_send': False,
+        'mender_check': False,
+        'mender_host': 'https://mender.flotech.co',
+        'mender_parts_link': '',
+        'mender_ping_delay': 300,
+        'mender_signature': '20200610',
+        'motor_delay_close': 175,
+        'motor_delay_open': 0,
+        'motor_retry_count': 2,
+        'motor_timeout': 5000,
+        'mqtt_host': 'mqtt.flosecurecloud.com',
+        'mqtt_port': 8884,
+        'pes_away_max_pressure': 150,
+        'pes_away_max_temperature': 226,
+        'pes_away_min_pressure': 20,
+        'pes_away_min_pressure_duration': 5,
+        'pes_away_min_temperature': 36,
+        'pes_away_min_temperature_duration': 10,
+        'pes_home_high_flow_rate': 1000,
+        'pes_home_high_flow_rate_duration': 20,
+        'pes_home_max_duration': 7200,
+        'pes_home_max_pressure': 150,
+        'pes_home_max_temperature': 226,
+        'pes_home_max_volume': 185,
+        'pes_home_min_pressure': 20,
+        'pes_home_min_temperature': 36,
+        'pes_moderately_high_pressure': 80,
+        'pes_moderately_high_pressure_count': 43200,
+        'player_action': 'disabled',
+        'player_flow': 0,
+        'player_min_pressure': 40,
+        'player_pressure': 60,
+        'player_temperature': 50,
+        'power_delay': 0,
+        'pt_state': 'ok',
+        'reboot_count': 26,
+        'reboot_reason': 'power_cycle',
+        's3_bucket_host': 'api-bulk.meetflo.com',
+        'serial_number': '111111111111',
+        'system_mode': 2,
+        'tag': '',
+        'telemetry_batched_enabled': True,
+        'telemetry_batched_hf_enabled': True,
+        'telemetry_batched_hf_interval': 10800,
+        'telemetry_batched_hf_poll_rate': 100,
+        'telemetry_batched_interval': 300,
+        'telemetry_batched_pending_storage': 30,
+        'telemetry_batched_sent_storage': 30,
+        'telemetry_flow_rate': 0,
+        'telemetry_pressure': 62.3,
+        'telemetry_realtime_change_gpm': 0,
+        'telemetry_realtime_change_psi': 0,
+        'telemetry_realtime_interval': 1,
+        'telemetry_realtime_packet_uptime': 0,
+        'telemetry_realtime_session_last_epoch': 1597433743,
+        'telemetry_realtime_sessions_7d': 98,
+        'telemetry_realtime_storage': 7,
+        'telemetry_realtime_timeout': 299,
+        'telemetry_temperature': 58,
+        'valve_actuation_count': 906,
+        'valve_actuation_timeout_count': 0,
+        'valve_state': 1,
+        'vpn_enabled': False,
+        'wifi_bytes_received': 1041216108,
+        'wifi_bytes_sent': 1164624816,
+        'wifi_rssi': -50,
+        'wifi_sta_enc': 'psk2',
+        'wifi_sta_mac': '111111111111',
+        'wifi_sta_ssid': 'SSID',
+        'zit_auto_count': 2412,
+        'zit_manual_count': 0
+    },
+    'id': 'device-0',
+    'macAddress': '111111111111',
+    'nickname': 'Smart Water Shutoff',
+    'isPaired': True,
+    'deviceModel': 'flo_device_075_v2',
+    'deviceType': 'flo_device_v2',
+    'irrigationType': 'sprinklers',
+    'systemMode': {'isLocked': False, 'shouldInherit': True, 'lastKnown': 'home', 'target': 'home'},
+    'valve': {'target': 'open', 'lastKnown': 'open'},
+    'installStatus': {'isInstalled': True, 'installDate': '2019-05-04T13:50:04.758Z'},
+    'learning': {'outOfLearningDate': '2019-05-10T21:45:48.916Z'},
+    'notifications': {'pending': {'infoCount': 0, 'warningCount': 2, 'criticalCount': 0,
+                                  'alarmCount': [{'id': 30, 'severity': 'warning', 'count': 1},
+                                                 {'id': 31, 'severity': 'warning', 'count': 1}]}},
+    'hardwareThresholds': {
+        'gpm': {'okMin': 0, 'okMax': 29, 'minValue': 0, 'maxValue': 35},
+        'psi': {'okMin': 30, 'okMax': 80, 'minValue': 0, 'maxValue': 100},
+        'lpm': {'okMin': 0, 'okMax': 110, 'minValue': 0, 'maxValue': 130},
+        'kPa': {'okMin': 210, 'okMax': 550, 'minValue': 0, 'maxValue': 700},
+        'tempF': {'okMin': 50, 'okMax': 80, 'minValue': 0, 'maxValue': 100},
+        'tempC': {'okMin': 10, 'okMax': 30, 'minValue': 0, 'maxValue': 40}
+    },
+    'serialNumber': '111111111111',
+    'connectivity': {'rssi': -50, 'ssid': 'SSID'},
+    'telemetry': {'current': {'gpm': 0, 'psi': 62.3, 'tempF': 58, 'updated': '2020-08-14T19:37:04Z'}},
+    'healthTest': {'config': {'enabled': True, 'timesPerDay': 1, 'start': '02:00', 'end': '04:00'}},
+    'shutoff': {'scheduledAt': '1970-01-01T00:00:00.000Z'},
+    'actionRules': [],
+    'location': {'id': 'location-0'},
+    'pes': {'schedule': {'status': 'ok', 'lastUpdated': '2020-08-14T03:29:34.017Z'}},
+    'floSense': {'shutoffLevel': 2, 'userEnabled': True},
+    'audio': {'snoozeTo': '2020-08-10T16:16:27.000Z', 'snoozeSeconds': 3600},
+    'firmwareProperties': {}
+}
+
+
+def measure(build, num_devices):
+    """Return the bytes allocated to hold num_devices objects created by build(index)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = {f"device-{d}": build(d) for d in range(num_devices)}
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del cache
+    return allocated
+
+
+def raw_payload(index):
+    # each refresh decodes a fresh payload, so nothing is shared between devices
+    payload = copy.deepcopy(DEVICE_PAYLOAD)
+    payload['id'] = f"device-{index}"
+    return payload
+
+
+def snapshot(index):
+    return DeviceSnapshot.from_payload(raw_payload(index))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    print(f"{'devices':>8} {'raw (KiB)':>10} {'snapshot (KiB)':>15} {'per device raw/snapshot (B)':>28}")
+    for num_devices in args.devices:
+        raw = measure(raw_payload, num_devices)
+        # the decoded payload is discarded once projected, so only the snapshot stays allocated
+        compact = measure(snapshot, num_devices)
+        print(f"{num_devices:>8} {raw / 1024:>10.1f} {compact / 1024:>15.1f} "
+              f"{raw // num_devices:>16} / {compact // num_devices}")
+
+
+if __name__ == '__main__':
+    main()
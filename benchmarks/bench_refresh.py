@@ -0,0 +1,74 @@
+"""
+Benchmark coordinator refresh wall-clock time as the number of Flo devices grows.
+
+Uses a simulated Flo client with fixed per-request latency (no network), so concurrency
+is not capped by FloClient's connection pool (DEFAULT_POOL_SIZE) as it is live, e.g.:
+
+    python benchmarks/bench_refresh.py --latency 0.2 --devices 1 10 50 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from custom_components.flo.coordinator import async_refresh, DEFAULT_MAX_CONCURRENCY  # noqa: E402
+
+
+class SimulatedFloClient:
+    """Stand-in for FloClient returning canned payloads after a fixed latency"""
+
+    def __init__(self, num_devices, num_locations, latency):
+        self._latency = latency
+        self._locations = [
+            {'id': f"location-{l}", 'nickname': f"Location {l}", 'devices': []}
+            for l in range(num_locations)
+        ]
+        for d in range(num_devices):
+            self._locations[d % num_locations]['devices'].append({'id': f"device-{d}"})
+
+    async def async_locations(self):
+        await asyncio.sleep(self._latency)
+        return self._locations
+
+    async def async_device(self, device_id):
+        await asyncio.sleep(self._latency)
+        return {
+            'id': device_id,
+            'telemetry': {'current': {'gpm': 0.0, 'psi': 62.3, 'tempF': 58}},
+            'valve': {'target': 'open', 'lastKnown': 'open'}
+        }
+
+
+async def async_benchmark(num_devices, num_locations, latency, max_concurrency, rounds):
+    flo = SimulatedFloClient(num_devices, num_locations, latency)
+    cache = {}
+    elapsed = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await async_refresh(flo, cache, max_concurrency)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--locations', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.1, help='simulated seconds per request')
+    parser.add_argument('--max-concurrency', type=int, nargs='+', default=[1, DEFAULT_MAX_CONCURRENCY, 200])
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'devices':>8} {'concurrency':>12} {'refresh (s)':>12}")
+    for max_concurrency in args.max_concurrency:
+        for num_devices in args.devices:
+            elapsed = asyncio.run(async_benchmark(
+                num_devices, min(args.locations, num_devices), args.latency, max_concurrency, args.rounds))
+            print(f"{num_devices:>8} {max_concurrency:>12} {elapsed:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Replay a capture of real Flo responses (see the capture option of the integration)
+through FloScheduler at max speed, offline and reproducibly. Runs telemetry refresh
+cycles until every captured device response was replayed, reporting refresh time,
+entity updates (see bench_suite.py) and the bogus temperatures filtered out, e.g.:
+
+    python benchmarks/bench_replay.py ~/.homeassistant/flo_capture.jsonl
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.flo.capture import ResponseReplay, SPEED_MAX  # noqa: E402
+from custom_components.flo.client import FloClient  # noqa: E402
+from custom_components.flo.coordinator import (  # noqa: E402
+    FloScheduler,
+    DEFAULT_SCAN_INTERVALS,
+    DATA_CLASS_MODE,
+    DATA_CLASS_TELEMETRY
+)
+from custom_components.flo.telemetry import MAX_VALID_TEMP_F  # noqa: E402
+from bench_suite import count_entity_updates  # noqa: E402
+
+# cycles are driven by the benchmark, so keep the coordinators from polling on their own
+IDLE_INTERVALS = {data_class: timedelta(days=1) for data_class in DEFAULT_SCAN_INTERVALS}
+
+
+async def async_replay(path, max_cycles):
+    replay = ResponseReplay(ResponseReplay.load(path), SPEED_MAX)
+    flo = FloClient('replay', 'replay', replay=replay)
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+        scheduler = FloScheduler(hass, flo, IDLE_INTERVALS)
+
+        latencies = []
+        updates = []
+        filtered_temps = 0
+        try:
+            await scheduler.coordinator(DATA_CLASS_MODE).async_refresh()
+            received, stop = count_entity_updates(hass, scheduler.device_ids)
+            coordinator = scheduler.coordinator(DATA_CLASS_TELEMETRY)
+            while len(latencies) < max_cycles and not replay.exhausted('/devices/'):
+                received[0] = 0
+                start = time.perf_counter()
+                await coordinator.async_refresh()
+                latencies.append(time.perf_counter() - start)
+                updates.append(received[0])
+
+                filtered_temps += sum(1 for device_id in scheduler.telemetry_history
+                                      if (scheduler.cache[device_id].temp_f or 0) > MAX_VALID_TEMP_F)
+            stop()
+        finally:
+            await scheduler.async_stop()
+            await flo.async_close()
+            await hass.async_stop(force=True)
+
+    return replay.count, latencies, updates, filtered_temps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='capture file of Flo responses')
+    parser.add_argument('--max-cycles', type=int, default=10000)
+    args = parser.parse_args()
+
+    responses, latencies, updates, filtered_temps = asyncio.run(async_replay(args.capture, args.max_cycles))
+    if not latencies:
+        print(f"No telemetry cycles replayed from {responses} captured responses")
+        return
+
+    print(f"replayed {responses} captured responses in {len(latencies)} telemetry cycles")
+    print(f"refresh (ms):         median {statistics.median(latencies) * 1000:.2f}, max {max(latencies) * 1000:.2f}")
+    print(f"updates per cycle:    mean {statistics.mean(updates):.1f}, total {sum(updates)}")
+    print(f"filtered temps (>{MAX_VALID_TEMP_F}F): {filtered_temps}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark suite running the integration's FloClient and FloScheduler against the
+simulated Flo cloud (see simulator.py) for growing fleets, reporting per fleet size:
+
+- cold start:   login and location discovery with no snapshot (time until entities can be created)
+- warm start:   restoring the persisted snapshot instead
+- refresh:      median and max wall-clock time of a telemetry refresh cycle
+- requests:     requests received by the simulated cloud per telemetry cycle
+- updates:      entity updates dispatched per telemetry cycle, i.e. field change signals
+                received by the device entities' subscriptions (an upper bound of state
+                writes, since deadbanded sensors skip small changes)
+- memory:       memory retained by the integration per device after all cycles
+
+Every run is a baseline to compare later changes against, e.g.:
+
+    python benchmarks/bench_suite.py --devices 1 10 200 --latency 0.05 --churn 0.5 --cycles 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from homeassistant.core import HomeAssistant, callback  # noqa: E402
+from homeassistant.helpers.dispatcher import async_dispatcher_connect  # noqa: E402
+
+from custom_components.flo.client import FloClient  # noqa: E402
+from custom_components.flo.coordinator import (  # noqa: E402
+    FloScheduler,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_SCAN_INTERVALS,
+    DATA_CLASS_MODE,
+    DATA_CLASS_TELEMETRY
+)
+from custom_components.flo.diff import field_signal  # noqa: E402
+from custom_components.flo.binary_sensor import FloLeakSensor  # noqa: E402
+from custom_components.flo.sensor import FloRateSensor, FloTempSensor, FloPressureSensor  # noqa: E402
+from custom_components.flo.switch import FloWaterValve  # noqa: E402
+from simulator import SimulatedFloCloud  # noqa: E402
+
+# cycles are driven by the benchmark, so keep the coordinators from polling on their own
+IDLE_INTERVALS = {data_class: timedelta(days=1) for data_class in DEFAULT_SCAN_INTERVALS}
+
+INTEGRATION_FILES = os.path.join('*', 'custom_components', 'flo', '*')
+
+# device entities updated by telemetry refreshes
+TELEMETRY_ENTITIES = (FloRateSensor, FloTempSensor, FloPressureSensor, FloWaterValve, FloLeakSensor)
+
+
+def count_entity_updates(hass, device_ids):
+    """Subscribe to the field signals of each device's telemetry entities like the entities do.
+
+    Returns a list holding the number of entity updates received, and a callable unsubscribing.
+    """
+    received = [0]
+
+    @callback
+    def async_count():
+        received[0] += 1
+
+    unsubscribe = [
+        async_dispatcher_connect(hass, field_signal(device_id, path), async_count)
+        for device_id in device_ids
+        for entity_class in TELEMETRY_ENTITIES
+        for path in entity_class.SOURCE_FIELDS
+    ]
+
+    def stop():
+        for remove in unsubscribe:
+            remove()
+    return received, stop
+
+
+def _scheduler(hass, flo, storage_id, max_concurrency):
+    return FloScheduler(hass, flo, IDLE_INTERVALS, max_concurrency, storage_id=storage_id)
+
+
+async def async_cold_start(hass, cloud, storage_id, max_concurrency):
+    """Return the scheduler and client after a cold start, and the time it took"""
+    flo = FloClient('bench@example.com', 'password', **cloud.client_kwargs())
+    scheduler = _scheduler(hass, flo, storage_id, max_concurrency)
+
+    start = time.perf_counter()
+    await scheduler.async_load()
+    await flo.async_authenticate()
+    await scheduler.coordinator(DATA_CLASS_MODE).async_refresh()
+    return scheduler, flo, time.perf_counter() - start
+
+
+async def async_warm_start(hass, flo, storage_id, max_concurrency):
+    scheduler = _scheduler(hass, flo, storage_id, max_concurrency)
+    start = time.perf_counter()
+    await scheduler.async_load()
+    elapsed = time.perf_counter() - start
+    await scheduler.async_stop()
+    return elapsed
+
+
+async def async_cycles(hass, scheduler, cloud, cycles):
+    """Run telemetry refresh cycles, returning (latencies, requests, entity updates) per cycle"""
+    received, stop = count_entity_updates(hass, scheduler.device_ids)
+
+    latencies = []
+    requests = []
+    updates = []
+    coordinator = scheduler.coordinator(DATA_CLASS_TELEMETRY)
+    for _ in range(cycles):
+        cloud.reset_counters()
+        received[0] = 0
+
+        start = time.perf_counter()
+        await coordinator.async_refresh()
+        latencies.append(time.perf_counter() - start)
+        requests.append(cloud.request_count)
+        updates.append(received[0])
+
+    stop()
+    return latencies, requests, updates
+
+
+async def async_memory_per_device(hass, cloud, num_devices, cycles, max_concurrency):
+    """Return the bytes retained per device by allocations made in the integration's code"""
+    tracemalloc.start()
+    try:
+        scheduler, flo, _ = await async_cold_start(hass, cloud, 'memory', max_concurrency)
+        for _ in range(cycles):
+            await scheduler.coordinator(DATA_CLASS_TELEMETRY).async_refresh()
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, INTEGRATION_FILES)])
+        retained = sum(stat.size for stat in snapshot.statistics('filename'))
+    finally:
+        tracemalloc.stop()
+
+    await scheduler.async_stop()
+    await flo.async_close()
+    return retained / num_devices
+
+
+async def async_benchmark(num_devices, args):
+    cloud = SimulatedFloCloud(num_devices, min(args.locations, num_devices), args.latency,
+                              args.fail_rate, jitter=args.jitter, churn=args.churn)
+    await cloud.async_start()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+        try:
+            scheduler, flo, cold_start = await async_cold_start(hass, cloud, 'bench', args.max_concurrency)
+            latencies, requests, updates = await async_cycles(hass, scheduler, cloud, args.cycles)
+
+            # persist the snapshot, then restore it as the next startup would
+            await scheduler.async_stop()
+            warm_start = await async_warm_start(hass, flo, 'bench', args.max_concurrency)
+            await flo.async_close()
+
+            memory = await async_memory_per_device(hass, cloud, num_devices, args.cycles, args.max_concurrency)
+        finally:
+            await hass.async_stop(force=True)
+            await cloud.async_stop()
+
+    return {
+        'cold_start': cold_start,
+        'warm_start': warm_start,
+        'refresh_median': statistics.median(latencies),
+        'refresh_max': max(latencies),
+        'requests': statistics.mean(requests),
+        'updates': statistics.mean(updates),
+        'memory': memory
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--locations', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='max random seconds added to the latency')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='probability of a 503 response')
+    parser.add_argument('--churn', type=float, default=0.5, help='probability a device read has new telemetry')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument('--cycles', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'devices':>8} {'cold start (s)':>15} {'warm start (s)':>15} {'refresh p50 (s)':>16} "
+          f"{'refresh max (s)':>16} {'requests/cycle':>15} {'updates/cycle':>14} {'KiB/device':>11}")
+    for num_devices in args.devices:
+        result = asyncio.run(async_benchmark(num_devices, args))
+        print(f"{num_devices:>8} {result['cold_start']:>15.3f} {result['warm_start']:>15.4f} "
+              f"{result['refresh_median']:>16.3f} {result['refresh_max']:>16.3f} {result['requests']:>15.1f} "
+              f"{result['updates']:>14.1f} {result['memory'] / 1024:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Benchmark adding a telemetry sample and reading the rolling statistics as the
+window length grows (should stay flat, since both are O(1)), e.g.:
+
+    python benchmarks/bench_telemetry.py --capacity 60 720 8640 --samples 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from custom_components.flo.telemetry import TelemetryBuffer, FIELDS  # noqa: E402
+
+
+def benchmark(capacity, num_samples):
+    history = TelemetryBuffer(window=capacity * 10, capacity=capacity)
+    samples = [(i * 10, random.choice([0.0, 0.0, 1.5, 4.2]), random.uniform(55, 70), random.uniform(50, 60))
+               for i in range(num_samples)]
+
+    start = time.perf_counter()
+    for timestamp, gpm, psi, temp_f in samples:
+        history.add(timestamp, gpm, psi, temp_f)
+        for field in FIELDS:
+            history.stats(field)
+        history.flowing_seconds
+    return (time.perf_counter() - start) / num_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--capacity', type=int, nargs='+', default=[60, 720, 8640])
+    parser.add_argument('--samples', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'capacity':>9} {'add + stats (us/sample)':>24}")
+    for capacity in args.capacity:
+        print(f"{capacity:>9} {benchmark(capacity, args.samples) * 1e6:>24.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Local stand-in for the Flo cloud service (aiohttp web server), so the real FloClient
+can be exercised without an account or network access.
+
+Serves the endpoints used by the integration (auth, locations, device, valve, mode,
+health test and consumption) for a configurable fleet of locations/devices. Latency
+(with optional jitter), server errors and outages can be injected, and a fraction of
+the devices report changed telemetry on every read so refreshes cause real updates, e.g.:
+
+    python benchmarks/simulator.py --devices 10 --latency 0.1 --jitter 0.05 --fail-rate 0.2 --churn 0.5
+
+FloClient is pointed at the simulator with SimulatedFloCloud.client_kwargs().
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+TOKEN = 'simulated-token'
+TOKEN_LIFETIME = 86400
+USER_ID = 'simulated-user'
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'  # UTC, as sent by FloClient
+
+
+class SimulatedFloCloud:
+    """In-process Flo cloud with canned payloads and failure injection"""
+
+    def __init__(self, num_devices=1, num_locations=1, latency=0.0, fail_rate=0.0, host='127.0.0.1', port=0,
+                 jitter=0.0, churn=0.0):
+        self.latency = latency
+        self.jitter = jitter  # up to this many seconds are randomly added to the latency
+        self.fail_rate = fail_rate  # probability of answering a request with a server error
+        self.outage = False  # when set, every request fails with a server error
+        self.churn = churn  # probability a device reports changed telemetry when read
+
+        self.request_count = 0
+        self.failed_count = 0
+        self.endpoint_counts = Counter()  # route -> requests
+
+        self._host = host
+        self._port = port
+        self._runner = None
+
+        num_locations = max(1, min(num_locations, num_devices))
+        self.locations = {
+            f"location-{l}": {'id': f"location-{l}", 'nickname': f"Location {l}", 'devices': [],
+                              'systemMode': {'target': 'home'}}
+            for l in range(num_locations)
+        }
+        self.devices = {}
+        for d in range(num_devices):
+            location = self.locations[f"location-{d % num_locations}"]
+            device = {
+                'id': f"device-{d}",
+                'macAddress': f"00:00:00:00:{d // 256:02x}:{d % 256:02x}",
+                'location': {'id': location['id']},
+                'telemetry': {'current': {'gpm': 0.0, 'psi': 62.3, 'tempF': 58}},
+                'valve': {'target': 'open', 'lastKnown': 'open'}
+            }
+            self.devices[device['id']] = device
+            location['devices'].append({'id': device['id'], 'macAddress': device['macAddress']})
+
+    @property
+    def url(self):
+        return f"http://{self._host}:{self._port}"
+
+    def client_kwargs(self):
+        """Keyword arguments pointing a FloClient at this simulator"""
+        return {
+            'api_base': f"{self.url}/api/v2",
+            'auth_url': f"{self.url}/api/v1/users/auth"
+        }
+
+    def reset_counters(self):
+        self.request_count = 0
+        self.failed_count = 0
+        self.endpoint_counts.clear()
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.request_count += 1
+        route = request.match_info.route.resource
+        self.endpoint_counts[f"{request.method} {route.canonical if route else request.path}"] += 1
+
+        latency = self.latency + random.uniform(0, self.jitter)
+        if latency:
+            await asyncio.sleep(latency)
+
+        if self.outage or random.random() < self.fail_rate:
+            self.failed_count += 1
+            raise web.HTTPServiceUnavailable()
+
+        if request.path != '/api/v1/users/auth' and request.headers.get('authorization') != TOKEN:
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+
+    def _app(self):
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post('/api/v1/users/auth', self._auth)
+        app.router.add_get('/api/v2/users/{user_id}', self._user)
+        app.router.add_get('/api/v2/locations/{location_id}', self._location)
+        app.router.add_post('/api/v2/locations/{location_id}/systemMode', self._system_mode)
+        app.router.add_get('/api/v2/devices/{device_id}', self._device)
+        app.router.add_post('/api/v2/devices/{device_id}', self._set_valve)
+        app.router.add_post('/api/v2/devices/{device_id}/healthTest/run', self._health_test)
+        app.router.add_get('/api/v2/water/consumption', self._consumption)
+        return app
+
+    async def async_start(self):
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        self._port = self._runner.addresses[0][1]
+
+    async def async_stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _auth(self, request):
+        return web.json_response({
+            'token': TOKEN,
+            'tokenExpiration': TOKEN_LIFETIME,
+            'tokenPayload': {'user': {'user_id': USER_ID}}
+        })
+
+    async def _user(self, request):
+        return web.json_response({'id': USER_ID, 'locations': list(self.locations.values())})
+
+    def _get(self, items, id):
+        if id not in items:
+            raise web.HTTPNotFound()
+        return items[id]
+
+    async def _location(self, request):
+        return web.json_response(self._get(self.locations, request.match_info['location_id']))
+
+    async def _system_mode(self, request):
+        location = self._get(self.locations, request.match_info['location_id'])
+        location['systemMode'] = {'target': (await request.json())['target']}
+        return web.json_response({})
+
+    async def _device(self, request):
+        device = self._get(self.devices, request.match_info['device_id'])
+        if random.random() < self.churn:
+            current = device['telemetry']['current']
+            current['gpm'] = round(random.choice([0.0, random.uniform(0.5, 5.0)]), 2)
+            current['psi'] = round(random.uniform(55.0, 70.0), 1)
+        return web.json_response(device)
+
+    async def _set_valve(self, request):
+        device = self._get(self.devices, request.match_info['device_id'])
+        target = (await request.json())['valve']['target']
+        device['valve'] = {'target': target, 'lastKnown': target}
+        return web.json_response(device)
+
+    async def _health_test(self, request):
+        self._get(self.devices, request.match_info['device_id'])
+        return web.json_response({'status': 'pending'})
+
+    async def _consumption(self, request):
+        """One item per hour or day of the requested range"""
+        start = datetime.strptime(request.query['startDate'], TIME_FORMAT).replace(tzinfo=timezone.utc)
+        end = datetime.strptime(request.query['endDate'], TIME_FORMAT).replace(tzinfo=timezone.utc)
+        step = timedelta(days=1) if request.query.get('interval') == '1d' else timedelta(hours=1)
+
+        items = []
+        while start <= end:
+            items.append({'time': start.strftime(TIME_FORMAT), 'gallonsConsumed': 42.0})
+            start += step
+        return web.json_response({
+            'params': dict(request.query),
+            'aggregations': {'sumTotalGallonsConsumed': 42.0 * len(items)},
+            'items': items
+        })
+
+
+async def async_serve(args):
+    cloud = SimulatedFloCloud(args.devices, args.locations, args.latency, args.fail_rate, port=args.port,
+                              jitter=args.jitter, churn=args.churn)
+    await cloud.async_start()
+    print(f"Simulated Flo cloud listening on {cloud.url} ({args.devices} devices)")
+    started = time.monotonic()
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"{cloud.request_count} requests ({cloud.failed_count} failed) "
+                  f"in {time.monotonic() - started:.0f}s: {dict(cloud.endpoint_counts)}")
+    finally:
+        await cloud.async_stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--locations', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='max random seconds added to the latency')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='probability of a 503 response')
+    parser.add_argument('--churn', type=float, default=0.0, help='probability a device read has new telemetry')
+    parser.add_argument('--port', type=int, default=8080)
+    try:
+        asyncio.run(async_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
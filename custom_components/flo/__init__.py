@@ -6,28 +6,56 @@ For good example of update, see Leaf sensor/switch:
 https://github.com/home-assistant/home-assistant/blob/dev/homeassistant/components/nissan_leaf/__init__.py
 """
 import logging
-import json
-import requests
 import asyncio
 import time
-import datetime
 import voluptuous as vol
 
-from requests.exceptions import HTTPError, ConnectTimeout
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from homeassistant.core import callback
-from homeassistant.helpers import discovery
+from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.storage import Store
 from homeassistant.const import (
-    CONF_EMAIL, CONF_USERNAME, CONF_PASSWORD, CONF_NAME, CONF_SCAN_INTERVAL, ATTR_ATTRIBUTION)
+    CONF_EMAIL, CONF_USERNAME, CONF_PASSWORD, CONF_NAME, CONF_SCAN_INTERVAL, CONF_TIMEOUT, CONF_FILENAME,
+    ATTR_ATTRIBUTION, EVENT_HOMEASSISTANT_STOP)
 from homeassistant.helpers.dispatcher import async_dispatcher_connect, async_dispatcher_send
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 import homeassistant.helpers.config_validation as cv
 
-from .const import FLO_DOMAIN, ATTRIBUTION, ATTR_CACHE, ATTR_COORDINATOR
-
-from pyflowater import PyFlo
+from .const import (
+    FLO_DOMAIN,
+    ATTRIBUTION,
+    ATTR_CACHE,
+    ATTR_SCHEDULER,
+    ATTR_DEADBANDS,
+    ATTR_MAX_SILENCE,
+    ATTR_LOCATIONS,
+    ATTR_YAML_CONFIG,
+    ATTR_UNSUBSCRIBE,
+    ATTR_VALVES,
+    ATTR_MODE_SENSORS,
+    ATTR_ENTITIES,
+    CONF_REPLAY
+)
+
+from .client import FloClient, FloError, FloAuthError, DEFAULT_TIMEOUT
+from .coordinator import (
+    FloScheduler,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_SCAN_INTERVALS,
+    DEFAULT_ADAPTIVE_MIN_INTERVAL,
+    DEFAULT_ADAPTIVE_MAX_INTERVAL,
+    DEFAULT_STATS_WINDOW,
+    DATA_CLASS_TELEMETRY,
+    DATA_CLASS_MODE
+)
+from .diff import field_signal
+from .services import async_register_services
+from .leak import DEFAULT_THRESHOLDS as DEFAULT_LEAK_THRESHOLDS, THRESHOLD_MAX_FLOW_DURATION, THRESHOLD_PRESSURE_DROP
+from .model import LocationSnapshot
+from .capture import ResponseCapture, ResponseReplay, REPLAY_SPEEDS, SPEED_REAL
+from .backfill import ConsumptionBackfill, DEFAULT_HISTORY
 
 LOG = logging.getLogger(__name__)
 
@@ -35,11 +63,58 @@ FLO_SERVICE = 'flo_service'
 
 NOTIFICATION_ID = 'flo_notification'
 
+PLATFORMS = ['sensor', 'switch', 'binary_sensor']
+
+AUTH_STORAGE_VERSION = 1
+AUTH_STORAGE_KEY = f"{FLO_DOMAIN}.auth"
+
 CONF_LOCATIONS = 'locations'
 CONF_LOCATION_ID = 'location_id'
+CONF_MAX_CONCURRENCY = 'max_concurrency'
+CONF_SCAN_INTERVALS = 'scan_intervals'
+CONF_ADAPTIVE_POLLING = 'adaptive_polling'
+CONF_MIN_INTERVAL = 'min_interval'
+CONF_MAX_INTERVAL = 'max_interval'
+CONF_DEADBANDS = 'deadbands'
+CONF_MAX_SILENCE = 'max_silence'
+CONF_REQUESTS_PER_MINUTE = 'requests_per_minute'
+CONF_STATS_WINDOW = 'stats_window'
+CONF_LEAK_DETECTION = 'leak_detection'
+CONF_AUTO_CLOSE = 'auto_close'
+CONF_CAPTURE = 'capture'
+CONF_SPEED = 'speed'
+CONF_STATISTICS = 'statistics'
+CONF_HISTORY = 'history'
+
+DEADBAND_FLOW = 'flow'
+DEADBAND_PRESSURE = 'pressure'
+DEADBAND_TEMPERATURE = 'temperature'
+
+# minimum change (gpm, psi, F) before a new sensor state is written
+DEFAULT_DEADBANDS = {
+    DEADBAND_FLOW: 0.1,
+    DEADBAND_PRESSURE: 0.5,
+    DEADBAND_TEMPERATURE: 1.0
+}
+# a change within the deadband is still written if the state has not been written for this long
+DEFAULT_MAX_SILENCE = timedelta(hours=1)
+
+# set while an entity is serving its last good data because refreshing from Flo is failing
+ATTR_STALE = 'stale'
+
+# rolling statistics of telemetry over the stats window
+ATTR_STATS_WINDOW = 'stats_window'
+
+# deprecated scan_intervals key
+SCAN_INTERVAL_VALVE = 'valve'
 
 # try to avoid DDoS Flo's cloud service
-SCAN_INTERVAL = timedelta(seconds=30)
+SCAN_INTERVAL = DEFAULT_SCAN_INTERVALS[DATA_CLASS_TELEMETRY]
+
+LEAK_THRESHOLDS_SCHEMA = vol.Schema({
+    vol.Optional(THRESHOLD_MAX_FLOW_DURATION): cv.time_period,
+    vol.Optional(THRESHOLD_PRESSURE_DROP): vol.Coerce(float)
+})
 
 CONFIG_SCHEMA = vol.Schema({
     FLO_DOMAIN: vol.Schema({
@@ -47,128 +122,290 @@ CONFIG_SCHEMA = vol.Schema({
         vol.Required(CONF_PASSWORD): cv.string,
         vol.Optional(CONF_LOCATIONS, default=[]): cv.ensure_list,
         vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_SCAN_INTERVALS, default={}): vol.Schema({
+            **{vol.Optional(data_class): cv.time_period for data_class in DEFAULT_SCAN_INTERVALS},
+            # valve state is refreshed with the telemetry (same device endpoint), so no longer polled separately
+            vol.Remove(SCAN_INTERVAL_VALVE): cv.time_period
+        }),
+        vol.Optional(CONF_ADAPTIVE_POLLING): vol.Schema({
+            vol.Optional(CONF_MIN_INTERVAL, default=DEFAULT_ADAPTIVE_MIN_INTERVAL): cv.time_period,
+            vol.Optional(CONF_MAX_INTERVAL, default=DEFAULT_ADAPTIVE_MAX_INTERVAL): cv.time_period
+        }),
+        vol.Optional(CONF_DEADBANDS, default={}): vol.Schema({
+            vol.Optional(deadband): vol.Coerce(float) for deadband in DEFAULT_DEADBANDS
+        }),
+        vol.Optional(CONF_MAX_SILENCE, default=DEFAULT_MAX_SILENCE): cv.time_period,
+        vol.Optional(CONF_STATS_WINDOW, default=DEFAULT_STATS_WINDOW): cv.time_period,
+        vol.Optional(CONF_LEAK_DETECTION, default={}): vol.Schema({
+            vol.Optional(CONF_AUTO_CLOSE, default=False): cv.boolean,
+            **{vol.Optional(mode): LEAK_THRESHOLDS_SCHEMA for mode in DEFAULT_LEAK_THRESHOLDS}
+        }),
+        vol.Optional(CONF_TIMEOUT, default=DEFAULT_TIMEOUT): cv.positive_int,
+        vol.Optional(CONF_MAX_CONCURRENCY, default=DEFAULT_MAX_CONCURRENCY): cv.positive_int,
+        vol.Optional(CONF_REQUESTS_PER_MINUTE): cv.positive_int,
+        # import the hourly consumption history into long-term statistics
+        vol.Optional(CONF_STATISTICS): vol.Schema({
+            vol.Optional(CONF_HISTORY, default=DEFAULT_HISTORY): cv.time_period
+        }),
+        # capture Flo responses to a file (relative to the config dir), or replay a capture instead of using Flo
+        vol.Exclusive(CONF_CAPTURE, CONF_CAPTURE): cv.string,
+        vol.Exclusive(CONF_REPLAY, CONF_CAPTURE): vol.Schema({
+            vol.Required(CONF_FILENAME): cv.string,
+            vol.Optional(CONF_SPEED, default=SPEED_REAL): vol.In(REPLAY_SPEEDS)
+        }),
         vol.Optional(CONF_USERNAME): cv.string # backwards compatibility
     })
 }, extra=vol.ALLOW_EXTRA)
 
-async def async_setup_entry(hass, entry):
-    return
+async def async_setup(hass, config):
+    """Import any configuration.yaml Flo account as a config entry"""
+    hass.data.setdefault(FLO_DOMAIN, {})
 
-def setup(hass, config):
-    """Set up the Flo Water Control System"""
+    # entity_id -> entity for all Flo accounts, so services can look up their targets directly
+    hass.data[FLO_DOMAIN][ATTR_ENTITIES] = {}
+
+    # services act on all Flo accounts, so are registered once for the integration
+    async_register_services(hass)
 
     conf = config.get(FLO_DOMAIN)
     if not conf:
-        LOG.error(f"Configuration domain {FLO_DOMAIN} cannot be found in config, ignoring setup!")
-        return
+        return True
 
     email = conf.get(CONF_EMAIL)
     if not email:
         email = conf.get(CONF_USERNAME)
         LOG.error(f"Deprecated {CONF_USERNAME} key used in flo: config, please change this to {CONF_EMAIL} as this will break in future releases!")
 
-    password = conf.get(CONF_PASSWORD)
+    # the tuning options only live in configuration.yaml, the config entry just holds the credentials
+    hass.data[FLO_DOMAIN][ATTR_YAML_CONFIG] = {**conf, CONF_EMAIL: email}
 
-    try:
-        flo = PyFlo(email, password)
-        if not flo.is_connected:
-            LOG.error(f"Could not connect to Flo service with {email}")
-            return False
+    hass.async_create_task(
+        hass.config_entries.flow.async_init(
+            FLO_DOMAIN,
+            context={'source': SOURCE_IMPORT},
+            data={CONF_EMAIL: email, CONF_PASSWORD: conf[CONF_PASSWORD]}
+        )
+    )
+    return True
 
-        # save password to enable automatic re-authentication while this HA instance is running
-        flo.save_password(password)
 
-        hass.data[FLO_SERVICE] = flo
-        hass.data[FLO_DOMAIN] = {
-            ATTR_CACHE: {},
-            ATTR_COORDINATOR: None
-        }
+def _leak_thresholds(conf):
+    """Return the per-mode leak detection thresholds, overriding the defaults with any configured"""
+    thresholds = {}
+    for mode, defaults in DEFAULT_LEAK_THRESHOLDS.items():
+        configured = dict(conf.get(mode, {}))
+        if THRESHOLD_MAX_FLOW_DURATION in configured:
+            configured[THRESHOLD_MAX_FLOW_DURATION] = configured[THRESHOLD_MAX_FLOW_DURATION].total_seconds()
+        thresholds[mode] = {**defaults, **configured}
+    return thresholds
 
-    except (ConnectTimeout, HTTPError) as ex:
-        LOG.error(f"Unable to connect to Flo service: {str(ex)}")
-        hass.components.persistent_notification.create(
-            f"Error: {ex}<br />You will need to restart Home Assistant after fixing.",
-            title='Flo', notification_id=NOTIFICATION_ID
-        )
-        return False
 
-    locations = conf.get(CONF_LOCATIONS)
+def _entry_config(hass, entry):
+    """Return the configuration.yaml options for this entry's account, or the defaults"""
+    conf = hass.data[FLO_DOMAIN].get(ATTR_YAML_CONFIG)
+    if conf and conf.get(CONF_EMAIL) == entry.data[CONF_EMAIL]:
+        return conf
+    return CONFIG_SCHEMA({FLO_DOMAIN: dict(entry.data)})[FLO_DOMAIN]
+
+
+async def async_setup_entry(hass, entry):
+    """Set up the Flo Water Control System for a config entry"""
+    setup_started = time.monotonic()
+    hass.data.setdefault(FLO_DOMAIN, {})
+
+    conf = _entry_config(hass, entry)
+    email = entry.data[CONF_EMAIL]
+
+    # all Flo webservice calls share a single pooled async client for this account
+    token_store = Store(hass, AUTH_STORAGE_VERSION, f"{AUTH_STORAGE_KEY}.{entry.entry_id}")
+
+    capture = replay = None
+    requests_per_minute = conf.get(CONF_REQUESTS_PER_MINUTE)
+    if CONF_REPLAY in conf:
+        filename = hass.config.path(conf[CONF_REPLAY][CONF_FILENAME])
+        try:
+            entries = await hass.async_add_executor_job(ResponseReplay.load, filename)
+        except (OSError, ValueError) as ex:
+            LOG.error(f"Unable to load Flo responses to replay from {filename}: {ex}")
+            return False
+        replay = ResponseReplay(entries, conf[CONF_REPLAY][CONF_SPEED])
+        token_store = None  # never persist the replay token
+        requests_per_minute = None  # replayed responses don't count against any Flo budget
+    elif CONF_CAPTURE in conf:
+        capture = ResponseCapture(hass.config.path(conf[CONF_CAPTURE]))
+        await hass.async_add_executor_job(capture.open)
+
+    # if configured, every request for this account shares a single request budget
+    flo = FloClient(email, entry.data[CONF_PASSWORD], timeout=conf[CONF_TIMEOUT], token_store=token_store,
+                    requests_per_minute=requests_per_minute, capture=capture, replay=replay)
+
+    # reuse the auth token persisted by the previous run (if not expired) instead of a full login
+    await flo.async_load_auth()
+
+    # each class of Flo data is polled by its own coordinator at its own interval
+    # (scan_interval is kept as the telemetry interval for backwards compatibility)
+    scan_intervals = {DATA_CLASS_TELEMETRY: conf[CONF_SCAN_INTERVAL], **conf[CONF_SCAN_INTERVALS]}
+
+    adaptive_bounds = None
+    adaptive = conf.get(CONF_ADAPTIVE_POLLING)
+    if adaptive is not None:
+        adaptive_bounds = (adaptive[CONF_MIN_INTERVAL], adaptive[CONF_MAX_INTERVAL])
+
+    leak_detection = conf[CONF_LEAK_DETECTION]
+    scheduler = FloScheduler(hass, flo, scan_intervals, conf[CONF_MAX_CONCURRENCY], adaptive_bounds,
+                             storage_id=entry.entry_id, stats_window=conf[CONF_STATS_WINDOW],
+                             leak_thresholds=_leak_thresholds(leak_detection),
+                             leak_auto_close=leak_detection[CONF_AUTO_CLOSE])
+
+    # restore the last-known snapshot so entities can be created without waiting on Flo
+    warm_start = await scheduler.async_load()
+
+    async def async_abort_setup():
+        # the scheduler's coordinators are already polling, so must be stopped along with the client
+        await scheduler.async_stop()
+        await flo.async_close()
+
+    if not warm_start:
+        # cold start: nothing known about this account yet, so must login and discover locations first
+        try:
+            await flo.async_authenticate()
+        except FloAuthError as ex:
+            LOG.error(f"Unable to login to Flo service: {str(ex)}")
+            await async_abort_setup()
+            return False
+        except FloError as ex:
+            await async_abort_setup()
+            raise ConfigEntryNotReady(f"Unable to connect to Flo service: {ex}") from ex
+
+        coordinator = scheduler.coordinator(DATA_CLASS_MODE)
+        await coordinator.async_refresh()
+        if not coordinator.last_update_success:
+            # retried by Home Assistant, rather than reporting an account without locations
+            await async_abort_setup()
+            raise ConfigEntryNotReady(f"Unable to discover Flo locations for {email}")
+
+    locations = list(conf.get(CONF_LOCATIONS) or [])
 
     # if no locations specified, auto discover ALL Flo locations/devices for this account
     if not locations:
-        for location in flo.locations():
-            locations.append(location['id'])
+        for location_id in scheduler.location_ids:
+            locations.append(location_id)
             LOG.info(
-                f"Discovered Flo location {location['id']} ({location['nickname']})")
+                f"Discovered Flo location {location_id} ({scheduler.cache[location_id].nickname})")
 
         if not locations:
             LOG.error(
                 f"No device locations returned from Flo service for {email}")
-            return True
     else:
         LOG.info(f"Using manually configured Flo locations: {locations}")
 
-    async def async_update_flo_data():
-        await hass.async_add_executor_job(update_flo_data)
-
-    def update_flo_data():
-        # clear the pyflowater internal cache to force a fresh webservice call
-        flo = hass.data[FLO_SERVICE]
-        flo.clear_cache()
-
-        cache = hass.data[FLO_DOMAIN][ATTR_CACHE]
-        for location in flo.locations():
-            cache[location['id']] = location
-
-            # query Flo webservice for each of the devices
-            devices = location.get('devices')
-            for device in devices:
-                device_id = device['id']
-                cache[device_id] = flo.device(device_id)
-
-
-    # create the Flo service update coordinator
-    async def async_initialize_coordinator():
-        coordinator = DataUpdateCoordinator(
-            hass, LOG,
-            name=f"Flo Webservice",
-            update_method=async_update_flo_data,
-            # Set polling interval (will only be polled if there are subscribers)
-            update_interval=conf[CONF_SCAN_INTERVAL]
-        )
-        hass.data[FLO_DOMAIN][ATTR_COORDINATOR] = coordinator
-        hass.loop.create_task(coordinator.async_request_refresh())
+    async def async_close_flo_client(event):
+        await scheduler.async_stop()
+        await flo.async_close()
+
+    hass.data[FLO_DOMAIN][entry.entry_id] = {
+        FLO_SERVICE: flo,
+        ATTR_SCHEDULER: scheduler,
+        ATTR_CACHE: scheduler.cache,
+        ATTR_LOCATIONS: locations,
+        ATTR_DEADBANDS: {**DEFAULT_DEADBANDS, **conf[CONF_DEADBANDS]},
+        ATTR_MAX_SILENCE: conf[CONF_MAX_SILENCE].total_seconds(),
+        ATTR_VALVES: {},  # device_id -> valve switch
+        ATTR_MODE_SENSORS: {},  # location_id -> monitoring mode sensor
+        ATTR_UNSUBSCRIBE: [
+            hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_flo_client),
+            entry.add_update_listener(async_reload_entry)
+        ]
+    }
+
+    # create sensors/switches for all configured locations (platforms are set up concurrently)
+    await asyncio.gather(*[
+        hass.config_entries.async_forward_entry_setup(entry, platform) for platform in PLATFORMS
+    ])
+
+    # live data is reconciled with the snapshot in the background
+    hass.async_create_task(scheduler.async_refresh_all())
+
+    if CONF_STATISTICS in conf:
+        backfill = ConsumptionBackfill(hass, flo, entry.entry_id, conf[CONF_STATISTICS][CONF_HISTORY])
+        await backfill.async_load()
+        hass.data[FLO_DOMAIN][entry.entry_id][ATTR_UNSUBSCRIBE].append(backfill.async_start(scheduler))
+
+    LOG.info(f"Flo setup completed in {time.monotonic() - setup_started:.2f}s "
+             f"({'warm start from snapshot' if warm_start else 'cold start'})")
+    return True
 
-    # start the coordinator initialiation in the hass event loop
-    asyncio.run_coroutine_threadsafe(async_initialize_coordinator(), hass.loop).result()
 
-    # create sensors/switches for all configured locations
-    for location_id in locations:
-        discovery_info = {CONF_LOCATION_ID: location_id}
-        for component in ['sensor', 'switch']:
-            discovery.load_platform(
-                hass, component, FLO_DOMAIN, discovery_info, config)
+async def async_unload_entry(hass, entry):
+    """Unload the Flo platforms and close the connection pool for a config entry"""
+    unloaded = all(await asyncio.gather(*[
+        hass.config_entries.async_forward_entry_unload(entry, platform) for platform in PLATFORMS
+    ]))
+    if not unloaded:
+        return False
+
+    flo_data = hass.data[FLO_DOMAIN].pop(entry.entry_id)
+    for unsubscribe in flo_data[ATTR_UNSUBSCRIBE]:
+        unsubscribe()
 
+    await flo_data[ATTR_SCHEDULER].async_stop()
+    await flo_data[FLO_SERVICE].async_close()
     return True
 
 
+async def async_get_location(flo_data, location_id):
+    """Return a location snapshot, normally already cached (restored snapshot or initial discovery)"""
+    location = flo_data[ATTR_CACHE].get(location_id)
+    if not location:
+        try:
+            payload = await flo_data[FLO_SERVICE].async_location(location_id)
+            if payload:
+                location = LocationSnapshot.from_payload(payload)
+        except FloError as ex:
+            LOG.warning(f"Failed loading Flo location {location_id}: {ex}")
+    return location
+
+
+async def async_reload_entry(hass, entry):
+    """Reload the config entry (e.g. after credentials were updated)"""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 class FloEntity(Entity):
     """Base Entity class for Flo"""
 
-    def __init__(self, hass, name):
-        """Store service upon init."""
-        #super().(hass)
-        self.hass = hass
-        self._hass = hass
+    # classes of Flo data (see FloScheduler) whose refreshes update this entity
+    DATA_CLASSES = ()
+
+    # paths of the fields of the device/location payload this entity's state is derived from
+    SOURCE_FIELDS = ()
+
+    # if set, numeric states only get written when they move more than this deadband (see DEFAULT_DEADBANDS)
+    DEADBAND = None
+
+    def __init__(self, flo_data, name):
+        """Store the shared Flo account data (client, scheduler, cache) upon init."""
+        self._flo_data = flo_data
         self._name = name
         self._state = None
+        self._state_written = None  # monotonic time the current state was accepted
+        self._attrs_written = None  # monotonic time the cycle attributes were last written
+        self._state_changed = False
         self._attrs = {
             ATTR_ATTRIBUTION: ATTRIBUTION
         }
 
     @property
     def flo_service(self):
-        return self._hass.data[FLO_SERVICE]
+        return self._flo_data[FLO_SERVICE]
+
+    @property
+    def scheduler(self):
+        return self._flo_data[ATTR_SCHEDULER]
+
+    @property
+    def coordinators(self):
+        return [self.scheduler.coordinator(data_class) for data_class in self.DATA_CLASSES]
 
     @property
     def name(self):
@@ -178,77 +415,197 @@ class FloEntity(Entity):
     @property
     def should_poll(self):
         """Flo update coordinator notifies through listener when data has been updated"""
-        return True # FIXME: temporarily enable polling until coordinator triggers work
+        return False
 
     @property
-    def device_state_attributes(self):
-        """Return the device state attributes."""
+    def stale(self):
+        """True if the last refresh of any of this entity's data classes failed"""
+        return not all(coordinator.last_update_success for coordinator in self.coordinators)
+
+    @property
+    def available(self):
+        # during Flo outages the last good state is still served (marked as stale)
+        return not self.stale or self._state is not None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        if self.DATA_CLASSES:
+            return {**self._attrs, ATTR_STALE: self.stale}
         return self._attrs
 
     @property
     def state(self):
         return self._state
 
+    def _is_within_deadband(self, state):
+        """Return True if the new state is too close to the current state to be worth writing"""
+        if self.DEADBAND is None or self._state is None or state is None:
+            return False
+
+        flo_data = self._flo_data
+        if time.monotonic() - self._state_written >= flo_data[ATTR_MAX_SILENCE]:
+            return False
+
+        deadband = flo_data[ATTR_DEADBANDS][self.DEADBAND]
+        try:
+            # tolerate float representation error (e.g. 62.5 - 62.0 vs 0.5)
+            return abs(state - self._state) + 1e-9 < deadband
+        except TypeError:
+            return False
+
     def update_state(self, state):
         if state != self._state:
+            if self._is_within_deadband(state):
+                return
+
             self._state = state
+            self._state_written = time.monotonic()
+            self._state_changed = True
 
             unit = ''
             if self.unit_of_measurement:
                 unit = self.unit_of_measurement
             LOG.info(f"Updated {self.name} to {self.state} {unit}")
 
-        self.schedule_update_ha_state()
+    @property
+    def source_id(self):
+        """Id of the Flo device or location this entity's source fields belong to"""
+        return None
+
+    def update_from_cache(self):
+        """Update entity state from the data shared by the Flo update coordinator"""
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Called after a refresh changed one of this entity's source fields"""
+        self._state_changed = False
+        self.update_from_cache()
+
+        # deadbanded sensors only write meaningful state changes
+        if self.DEADBAND is None or self._state_changed:
+            self._attrs_written = time.monotonic()
+            self.async_write_ha_state()
+
+    @callback
+    def _handle_availability_update(self):
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self):
-        self.async_on_remove(
-            self._hass.data[FLO_DOMAIN][ATTR_COORDINATOR].async_add_listener(
-                self.schedule_update_ha_state(force_refresh=True)
+        # index this entity so services can find it by entity_id
+        entities = self.hass.data[FLO_DOMAIN][ATTR_ENTITIES]
+        entities[self.entity_id] = self
+        entity_id = self.entity_id
+        self.async_on_remove(lambda: entities.pop(entity_id, None))
+
+        # pick up any data refreshed before this entity was added
+        self.update_from_cache()
+
+        # entities are only pushed updates when one of their source fields changed
+        for path in self.SOURCE_FIELDS:
+            self.async_on_remove(
+                async_dispatcher_connect(
+                    self.hass, field_signal(self.source_id, path), self._handle_coordinator_update)
             )
-        )
+
+        for data_class in self.DATA_CLASSES:
+            self.async_on_remove(
+                async_dispatcher_connect(
+                    self.hass, self.scheduler.availability_signal(data_class), self._handle_availability_update)
+            )
+
+    async def async_update(self):
+        """Request a refresh from the Flo update coordinators (e.g. homeassistant.update_entity)"""
+        for coordinator in self.coordinators:
+            await coordinator.async_request_refresh()
 
 
 class FloDeviceEntity(FloEntity):
     """Base Entity class for Flo devices"""
 
-    def __init__(self, hass, name, device_id):
+    def __init__(self, flo_data, name, device_id):
         """Store service upon init."""
-        super().__init__(hass, name)
+        super().__init__(flo_data, name)
 
         self._device_id = device_id
         self._attrs['device_id'] = device_id
 
+    @property
+    def source_id(self):
+        return self._device_id
+
     @property
     def device_state(self):
-        """Get device data shared from the Flo update coordinator"""
-        return self._hass.data[FLO_DOMAIN][ATTR_CACHE].get(self._device_id)
+        """Get the device snapshot shared from the Flo update coordinator"""
+        return self._flo_data[ATTR_CACHE].get(self._device_id)
 
     def get_telemetry(self, field):
+        """Return the current telemetry field (gpm, psi or temp_f) of the device snapshot"""
         value = None
-
         if self.device_state:
-            telemetry = self.device_state.get('telemetry')
-            if telemetry:
-                current_states = telemetry.get('current')
-                value = current_states.get(field)
+            value = getattr(self.device_state, field)
 
         if value is None:
-            LOG.warning(
-                f"Could not get current {field} from Flo telemetry: {self.device_state}")
+            LOG.debug(f"No current {field} in Flo telemetry for device {self._device_id}")
         return value
 
+    # telemetry field whose rolling statistics are exposed as attributes (see update_window_stats)
+    WINDOW_FIELD = None
+
+    def update_cycle_attributes(self):
+        """Refresh the attributes that move with every telemetry refresh rather than with the source fields.
+
+        Returns True if they should be written right away instead of within max_silence.
+        """
+        self.update_window_stats(self.WINDOW_FIELD)
+        return False
+
+    @callback
+    def _handle_telemetry_cycle(self):
+        """Called after every telemetry refresh, so the cycle attributes don't go stale while idle"""
+        urgent = self.update_cycle_attributes()
+        silent = (self._attrs_written is None
+                  or time.monotonic() - self._attrs_written >= self._flo_data[ATTR_MAX_SILENCE])
+        if urgent or silent:
+            self._attrs_written = time.monotonic()
+            self.async_write_ha_state()
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+
+        self._attrs_written = time.monotonic()  # written when added
+        if self.WINDOW_FIELD:
+            self.async_on_remove(
+                async_dispatcher_connect(
+                    self.hass, self.scheduler.telemetry_cycle_signal, self._handle_telemetry_cycle)
+            )
+
+    def update_window_stats(self, field):
+        """Expose the rolling mean/min/max/stddev of a telemetry field over the stats window as attributes"""
+        history = self.scheduler.telemetry_history.get(self._device_id)
+        stats = history.stats(field) if history else None
+        if stats:
+            for stat, value in stats.items():
+                self._attrs[stat] = round(value, 2)
+            self._attrs[ATTR_STATS_WINDOW] = history.window
+        return history
+
 
 class FloLocationEntity(FloEntity):
     """Base Entity class for Location entities"""
 
-    def __init__(self, hass, name, location_id):
+    def __init__(self, flo_data, name, location_id):
         """Store service upon init."""
-        super().__init__(hass, name)
+        super().__init__(flo_data, name)
 
         self._location_id = location_id
         self._attrs['location_id'] = location_id
 
+    @property
+    def source_id(self):
+        return self._location_id
+
     @property
     def location_state(self):
-        """Get location data shared from the Flo update coordinator"""
-        return self._hass.data[FLO_DOMAIN][ATTR_CACHE].get(self._location_id)
+        """Get the location snapshot shared from the Flo update coordinator"""
+        return self._flo_data[ATTR_CACHE].get(self._location_id)
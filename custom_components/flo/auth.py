@@ -0,0 +1,127 @@
+"""
+Flo auth token management.
+
+The token and its expiry are persisted (so a restart does not need a full login),
+refreshed proactively before they expire (off the request path), and concurrent
+requests that find the token rejected share a single in-flight re-authentication.
+"""
+import asyncio
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+REFRESH_MARGIN = 3600  # seconds before expiry to proactively refresh the token
+MIN_VALIDITY = 60  # seconds of remaining validity required to use a token
+
+ATTR_TOKEN = 'token'
+ATTR_EXPIRES_AT = 'expires_at'
+ATTR_USER_ID = 'user_id'
+
+
+class FloAuth:
+    """Auth token for a Flo account"""
+
+    def __init__(self, authenticate, store=None, refresh_margin=REFRESH_MARGIN):
+        """authenticate is a coroutine function performing the full login, returning
+        (token, lifetime in seconds, user_id); store (optional) persists the token
+        and must provide async_load() and async_save(data)."""
+        self._authenticate = authenticate
+        self._store = store
+        self._refresh_margin = refresh_margin
+
+        self._token = None
+        self._expires_at = 0
+        self._user_id = None
+
+        self._inflight = None
+        self._refresh_timer = None
+
+    @property
+    def valid(self):
+        return bool(self._token) and time.time() < self._expires_at - MIN_VALIDITY
+
+    @property
+    def user_id(self):
+        return self._user_id
+
+    async def async_load(self):
+        """Restore a persisted token, returning True if it is still valid"""
+        if not self._store:
+            return False
+
+        data = await self._store.async_load()
+        if not data or data.get(ATTR_EXPIRES_AT, 0) - MIN_VALIDITY <= time.time():
+            return False
+
+        self._token = data[ATTR_TOKEN]
+        self._expires_at = data[ATTR_EXPIRES_AT]
+        self._user_id = data[ATTR_USER_ID]
+        self._schedule_refresh()
+        LOG.debug("Restored persisted Flo auth token")
+        return True
+
+    async def async_token(self):
+        """Return a valid token, authenticating first if required"""
+        if not self.valid:
+            await self.async_reauth()
+        return self._token
+
+    async def async_reauth(self, stale_token=None):
+        """Login again, sharing a single in-flight login across all concurrent callers.
+
+        If stale_token is given and another caller has already replaced it, no login is done.
+        """
+        if stale_token is not None and stale_token != self._token and self.valid:
+            return
+
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._async_login())
+            self._inflight.add_done_callback(self._clear_inflight)
+
+        # shield so that a cancelled caller does not cancel the login shared with others
+        await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, future):
+        self._inflight = None
+
+    async def _async_login(self):
+        token, lifetime, user_id = await self._authenticate()
+
+        self._token = token
+        self._expires_at = time.time() + lifetime
+        self._user_id = user_id
+        self._schedule_refresh()
+
+        if self._store:
+            await self._store.async_save({
+                ATTR_TOKEN: self._token,
+                ATTR_EXPIRES_AT: self._expires_at,
+                ATTR_USER_ID: self._user_id
+            })
+
+    def _schedule_refresh(self):
+        self.cancel()
+
+        # refresh at most half way through the token lifetime
+        delay = self._expires_at - time.time()
+        delay = max(delay - min(self._refresh_margin, delay / 2), 0)
+        self._refresh_timer = asyncio.get_event_loop().call_later(delay, self._proactive_refresh)
+
+    def _proactive_refresh(self):
+        self._refresh_timer = None
+
+        async def async_refresh():
+            try:
+                await self.async_reauth()
+            except Exception as ex:  # pylint: disable=broad-except
+                # the next request will retry the login if the token actually expires
+                LOG.warning(f"Failed proactively refreshing Flo auth token: {ex}")
+
+        asyncio.ensure_future(async_refresh())
+
+    def cancel(self):
+        """Cancel any scheduled proactive refresh"""
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
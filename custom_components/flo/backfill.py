@@ -0,0 +1,163 @@
+"""
+Import of the hourly Flo consumption of each device into Home Assistant long-term
+statistics (as external statistics), including the history from before the
+integration was installed or from outages.
+
+Each device has a persisted cursor (the next hour to import, and the running sum of
+gallons up to it), so every run only fetches the hours closed since the last one.
+History is fetched one bounded batch at a time and written before the next batch is
+requested, so memory stays constant regardless of the length of the history. Batches
+are requested at the lowest priority of the request budget and paced, so live
+polling is never starved.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from pyflowater.const import INTERVAL_HOURLY
+
+from .client import FloError
+from .const import FLO_DOMAIN
+from .ratelimit import PRIORITY_BACKFILL
+
+LOG = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{FLO_DOMAIN}.statistics_backfill"
+SAVE_DELAY = 30  # seconds
+
+DEFAULT_HISTORY = timedelta(days=365)  # history imported for a device seen for the first time
+BACKFILL_BATCH = timedelta(days=7)  # hours requested from Flo per call
+BACKFILL_BATCH_DELAY = 10  # seconds between calls, keeping the backfill to a fraction of the request budget
+BACKFILL_INTERVAL = timedelta(hours=1)
+
+# Flo may report recent hours late, so hours missing from this trailing window are fetched
+# again next run; older missing hours (e.g. the device was offline) are imported as empty
+BACKFILL_RECHECK = timedelta(hours=6)
+
+ATTR_CURSOR = 'cursor'  # start (UTC) of the next hour to import
+ATTR_SUM = 'sum'  # gallons consumed from the start of the history up to the cursor
+
+UNIT_GALLONS = 'gal'
+
+
+def statistic_id(device_id):
+    return f"{FLO_DOMAIN}:{slugify(f'water_consumption_{device_id}')}"
+
+
+def _utc(value):
+    """Return the UTC start of a Flo consumption item (naive times are local)"""
+    start = dt_util.parse_datetime(value)
+    return dt_util.as_utc(start) if start else None
+
+
+class ConsumptionBackfill:
+    """Imports the hourly consumption of all devices of a Flo account into long-term statistics"""
+
+    def __init__(self, hass, flo, storage_id=None, history=DEFAULT_HISTORY):
+        self._hass = hass
+        self._flo = flo
+        self._history = history
+        key = f"{STORAGE_KEY}.{storage_id}" if storage_id else STORAGE_KEY
+        self._store = Store(hass, STORAGE_VERSION, key)
+
+        # device_id -> { 'cursor': ISO UTC hour, 'sum': gallons }
+        self._cursors = {}
+        self._task = None
+        self.imported = 0  # hours imported since started
+
+    async def async_load(self):
+        self._cursors = await self._store.async_load() or {}
+
+    def _async_save(self):
+        self._store.async_delay_save(lambda: self._cursors, SAVE_DELAY)
+
+    def async_start(self, scheduler):
+        """Import the new hours of all the scheduler's devices now and then every BACKFILL_INTERVAL.
+
+        Returns a callable stopping the backfill.
+        """
+        def async_schedule(now=None):
+            if self._task and not self._task.done():
+                return  # previous run is still importing
+            self._task = self._hass.async_create_task(self.async_backfill(list(scheduler.device_ids)))
+
+        async_schedule()
+        unsubscribe = async_track_time_interval(self._hass, async_schedule, BACKFILL_INTERVAL)
+
+        def stop():
+            unsubscribe()
+            if self._task:
+                self._task.cancel()
+        return stop
+
+    async def async_backfill(self, device_ids):
+        """Import the hours closed since the last run for each device (one device at a time)"""
+        for device_id in device_ids:
+            try:
+                await self._async_backfill_device(device_id)
+            except FloError as ex:
+                LOG.warning(f"Failed importing Flo consumption history for {device_id}, resuming next run: {ex}")
+
+    async def _async_backfill_device(self, device_id):
+        end = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)  # only closed hours
+        cursors = self._cursors.get(device_id)
+        if cursors is None:
+            cursors = self._cursors[device_id] = {ATTR_CURSOR: (end - self._history).isoformat(), ATTR_SUM: 0.0}
+
+        metadata = {
+            'source': FLO_DOMAIN,
+            'statistic_id': statistic_id(device_id),
+            'name': f"Flo water consumption {device_id}",
+            'unit_of_measurement': UNIT_GALLONS,
+            'has_mean': False,
+            'has_sum': True
+        }
+
+        cursor = dt_util.parse_datetime(cursors[ATTR_CURSOR])
+        if cursor < end:
+            LOG.debug(f"Importing Flo consumption of {device_id} from {cursor} to {end}")
+
+        while cursor < end:
+            batch_end = min(cursor + BACKFILL_BATCH, end)
+            data = await self._flo.async_consumption(
+                device_id, start_date=cursor, end_date=batch_end - timedelta(seconds=1),
+                interval=INTERVAL_HOURLY, priority=PRIORITY_BACKFILL)
+
+            hours = []
+            for item in (data or {}).get('items', []):
+                start = _utc(item['time'])
+                if start and cursor <= start < batch_end:
+                    hours.append((start, item.get('gallonsConsumed') or 0))
+            hours.sort()
+
+            total = cursors[ATTR_SUM]
+            statistics = []
+            for start, gallons in hours:
+                total += gallons
+                statistics.append({'start': start, 'state': round(total, 2), 'sum': round(total, 2)})
+
+            if statistics:
+                async_add_external_statistics(self._hass, metadata, statistics)
+                self.imported += len(statistics)
+
+            # the cursor only moves past the hours written, or missing before the re-check window
+            next_cursor = min(batch_end, end - BACKFILL_RECHECK)
+            if hours:
+                next_cursor = max(next_cursor, hours[-1][0] + timedelta(hours=1))
+            next_cursor = max(next_cursor, cursor)
+
+            cursors[ATTR_CURSOR] = next_cursor.isoformat()
+            cursors[ATTR_SUM] = total
+            self._async_save()
+
+            if next_cursor < batch_end:
+                break  # resume from the missing hours next run
+            cursor = batch_end
+            if cursor < end:
+                await asyncio.sleep(BACKFILL_BATCH_DELAY)
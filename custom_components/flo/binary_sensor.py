@@ -0,0 +1,74 @@
+"""
+Support for leaks detected locally from Flo telemetry (see leak.py)
+"""
+import logging
+
+from homeassistant.components.binary_sensor import BinarySensorEntity, DEVICE_CLASS_MOISTURE
+from homeassistant.const import STATE_ON, STATE_OFF
+
+from .const import ATTR_LOCATIONS
+from .coordinator import DATA_CLASS_TELEMETRY, FIELD_LEAK
+from . import (
+    FloDeviceEntity,
+    FLO_DOMAIN,
+    async_get_location
+)
+
+LOG = logging.getLogger(__name__)
+
+ATTR_REASON = 'reason'
+ATTR_FLOW_DURATION = 'flow_duration'
+ATTR_PRESSURE_DROP = 'pressure_drop'
+
+async def async_setup_entry(hass, entry, add_sensors_callback):
+    """Setup a leak sensor for each Flo device of a Flo account"""
+    flo_data = hass.data[FLO_DOMAIN][entry.entry_id]
+
+    sensors = []
+    for location_id in flo_data[ATTR_LOCATIONS]:
+        location = await async_get_location(flo_data, location_id)
+        if not location:
+            LOG.warning(f"Flo location {location_id} not found, ignoring creation of Flo leak sensors")
+            continue
+
+        for device_id in location.device_ids:
+            sensors.append( FloLeakSensor(flo_data, device_id) )
+
+    add_sensors_callback(sensors)
+
+
+class FloLeakSensor(FloDeviceEntity, BinarySensorEntity):
+    """Leak detected locally from continuous flow or a pressure drop while the valve is closed"""
+
+    DATA_CLASSES = (DATA_CLASS_TELEMETRY,)
+    SOURCE_FIELDS = (FIELD_LEAK,)
+
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, 'Water Leak', device_id)
+
+    @property
+    def device_class(self):
+        return DEVICE_CLASS_MOISTURE
+
+    @property
+    def is_on(self):
+        return bool(self._state)
+
+    @property
+    def state(self):
+        return STATE_ON if self.is_on else STATE_OFF
+
+    def update_from_cache(self):
+        """Update sensor state"""
+        leak = self.scheduler.leaks.get(self._device_id)
+        self.update_state(leak)
+        self._attrs[ATTR_REASON] = leak
+
+        detector = self.scheduler.leak_detectors.get(self._device_id)
+        if detector:
+            self._attrs[ATTR_FLOW_DURATION] = round(detector.flow_duration)
+            self._attrs[ATTR_PRESSURE_DROP] = round(detector.pressure_drop, 1)
+
+    @property
+    def unique_id(self):
+        return f"flo_leak_{self._device_id}"
@@ -0,0 +1,101 @@
+"""
+Circuit breaker for the Flo cloud service.
+
+After repeated failures (connection errors, timeouts or server errors) the circuit
+opens and requests fail immediately instead of waiting on a service that is down.
+After a jittered, exponentially growing backoff a single trial request is let
+through (half-open): success closes the circuit, failure opens it again.
+"""
+import logging
+import random
+import time
+
+LOG = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+DEFAULT_FAILURE_THRESHOLD = 3  # consecutive failures before the circuit opens
+DEFAULT_BASE_BACKOFF = 30  # seconds the circuit first stays open
+DEFAULT_MAX_BACKOFF = 900
+DEFAULT_JITTER = 0.5  # backoff is randomly shortened by up to this fraction
+
+
+class CircuitBreaker:
+    """Tracks the health of the Flo service and decides whether requests may be attempted"""
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, base_backoff=DEFAULT_BASE_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF, jitter=DEFAULT_JITTER):
+        self._failure_threshold = failure_threshold
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._trips = 0  # consecutive times opened without a success, for the exponential backoff
+        self._retry_at = 0
+        self._trial_pending = False
+
+        self.opened_at = None  # wall clock time the circuit last opened
+
+    @property
+    def state(self):
+        if self._state == STATE_OPEN and time.monotonic() >= self._retry_at:
+            return STATE_HALF_OPEN
+        return self._state
+
+    @property
+    def retry_in(self):
+        """Seconds until the next trial request is allowed while open"""
+        return max(0.0, self._retry_at - time.monotonic()) if self._state == STATE_OPEN else 0.0
+
+    def allow_request(self):
+        """Return True if a request may be attempted now (only one trial request while half-open)"""
+        if self._state == STATE_CLOSED:
+            return True
+
+        if self._trial_pending or time.monotonic() < self._retry_at:
+            return False
+
+        self._state = STATE_HALF_OPEN
+        self._trial_pending = True
+        return True
+
+    def record_success(self):
+        if self._state != STATE_CLOSED:
+            LOG.info("Flo service recovered, closing circuit breaker")
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._trips = 0
+        self._trial_pending = False
+        self.opened_at = None
+
+    def record_failure(self):
+        if self._state == STATE_OPEN:
+            # requests already in flight when the circuit opened don't extend its backoff
+            return
+
+        self._failures += 1
+        if self._state == STATE_HALF_OPEN or self._failures >= self._failure_threshold:
+            self._open()
+
+    def record_cancelled(self):
+        """A request was cancelled before completing, so the trial (if any) must be retried"""
+        self._trial_pending = False
+
+    def _open(self):
+        backoff = min(self._max_backoff, self._base_backoff * 2 ** self._trips)
+        backoff *= 1 - random.uniform(0, self._jitter)
+        self._trips += 1
+
+        if self._state == STATE_CLOSED:
+            self.opened_at = time.time()
+            LOG.warning(f"Flo service failing, pausing requests for {backoff:.0f}s")
+        else:
+            LOG.debug(f"Flo service still failing, pausing requests for {backoff:.0f}s")
+
+        self._state = STATE_OPEN
+        self._retry_at = time.monotonic() + backoff
+        self._trial_pending = False
@@ -0,0 +1,133 @@
+"""
+Capture of Flo API responses to a file, and replay of captured responses.
+
+Captures are append-only JSON lines, one per response:
+
+    {"t": 1597434000.5, "m": "GET", "p": "/devices/...", "q": {...}, "s": 200, "b": {...}}
+
+(time received, method, path, query params, status and decoded body). Login
+responses are never captured since they hold the auth token. Captures contain
+account data (ids, addresses), so should be shared with care.
+
+When replaying, FloClient answers every request from the capture instead of the Flo
+cloud. At real speed a request is answered with the latest response captured for
+it at the same offset from the start of the capture; at max speed each request is
+answered with the next response captured for it, holding the last one once all
+are used.
+"""
+import json
+import logging
+import time
+from bisect import bisect_right
+
+LOG = logging.getLogger(__name__)
+
+SPEED_REAL = 'real'
+SPEED_MAX = 'max'
+REPLAY_SPEEDS = (SPEED_REAL, SPEED_MAX)
+
+REPLAY_TOKEN = 'replay'
+REPLAY_TOKEN_LIFETIME = 86400 * 365
+
+# query params that differ between capture and replay (consumption date ranges), ignored when matching
+REPLAY_IGNORED_PARAMS = ('startDate', 'endDate')
+
+
+def _key(method, path, params):
+    """Key matching a replayed request with its captured responses (user id masked)"""
+    segments = path.split('/')
+    if len(segments) > 2 and segments[1] == 'users':
+        segments[2] = '{id}'
+    params = tuple(sorted((key, str(value)) for key, value in (params or {}).items()
+                          if key not in REPLAY_IGNORED_PARAMS))
+    return method, '/'.join(segments), params
+
+
+class ResponseCapture:
+    """Appends the responses received by FloClient to a capture file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def open(self):
+        """Open the capture file (blocking, so call from an executor)"""
+        self._file = open(self.path, 'a', encoding='utf-8')
+        LOG.info(f"Capturing Flo responses to {self.path}")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            LOG.info(f"Captured {self.count} Flo responses to {self.path}")
+
+    def write(self, method, path, params, status, body):
+        """Append a response, flushed right away so a crash doesn't lose the end of the capture"""
+        if not self._file:
+            return
+        self._file.write(json.dumps({
+            't': round(time.time(), 3),
+            'm': method,
+            'p': path,
+            'q': params or {},
+            's': status,
+            'b': body
+        }, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self.count += 1
+
+
+class ResponseReplay:
+    """Answers FloClient requests with the responses of a capture"""
+
+    def __init__(self, entries, speed=SPEED_REAL):
+        self.speed = speed
+        self.user_id = None
+        self.count = len(entries)
+        self._started = None
+
+        # key -> offsets from the start of the capture, and (status, body) captured at each offset
+        self._offsets = {}
+        self._responses = {}
+        self._next = {}  # key -> index of the next response (max speed)
+
+        first = entries[0]['t'] if entries else 0
+        for entry in entries:
+            if self.user_id is None and entry['p'].startswith('/users/'):
+                self.user_id = entry['p'].split('/')[2]
+
+            key = _key(entry['m'], entry['p'], entry['q'])
+            self._offsets.setdefault(key, []).append(entry['t'] - first)
+            self._responses.setdefault(key, []).append((entry['s'], entry['b']))
+
+    @staticmethod
+    def load(path):
+        """Return the entries of a capture file (blocking, so call from an executor)"""
+        with open(path, encoding='utf-8') as capture_file:
+            entries = [json.loads(line) for line in capture_file if line.strip()]
+        entries.sort(key=lambda entry: entry['t'])
+        LOG.info(f"Loaded {len(entries)} Flo responses to replay from {path}")
+        return entries
+
+    def exhausted(self, path_prefix=''):
+        """True once every captured response (for paths with the prefix) was replayed (max speed only)"""
+        return all(self._next.get(key, 0) >= len(responses)
+                   for key, responses in self._responses.items() if key[1].startswith(path_prefix))
+
+    def response(self, method, path, params):
+        """Return the (status, body) captured for a request, or None if it was never captured"""
+        key = _key(method, path, params)
+        responses = self._responses.get(key)
+        if not responses:
+            return None
+
+        if self.speed == SPEED_MAX:
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+        if self._started is None:
+            self._started = time.monotonic()
+        index = bisect_right(self._offsets[key], time.monotonic() - self._started) - 1
+        return responses[max(index, 0)]
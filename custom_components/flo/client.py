@@ -0,0 +1,397 @@
+"""
+Native asyncio client for the Flo cloud service.
+
+All Flo webservice calls made by the integration go through FloClient, which keeps
+a single keep-alive connection pool per Flo account (instead of the blocking
+requests calls made by pyflowater in an executor thread).
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+
+from .auth import FloAuth
+from .breaker import CircuitBreaker, STATE_OPEN
+from .metrics import FloMetrics, ERROR_CIRCUIT_OPEN
+from .capture import REPLAY_TOKEN, REPLAY_TOKEN_LIFETIME
+from .ratelimit import RateLimiter, PRIORITY_COMMAND, PRIORITY_TELEMETRY, PRIORITY_CONSUMPTION
+
+from pyflowater.const import (
+    FLO_USER_AGENT,
+    FLO_V1_API_BASE,
+    FLO_V2_API_BASE,
+    FLO_TIME_FORMAT,
+    INTERVAL_HOURLY
+)
+
+LOG = logging.getLogger(__name__)
+
+METHOD_GET = 'GET'
+METHOD_POST = 'POST'
+
+DEFAULT_TIMEOUT = 10  # seconds per request
+DEFAULT_POOL_SIZE = 8  # max concurrent connections per Flo account
+KEEPALIVE_TIMEOUT = 60  # seconds an idle pooled connection is kept open
+
+ENDPOINT_AUTH = f"{METHOD_POST} /users/auth"
+
+# path segments following these are ids, which are masked so calls are counted per endpoint
+ID_RESOURCES = ('users', 'locations', 'devices')
+
+
+def flo_time(value):
+    """Format a datetime (naive times are local) as Flo expects: UTC with a trailing Z"""
+    return datetime.fromtimestamp(value.timestamp(), timezone.utc).strftime(FLO_TIME_FORMAT) + 'Z'
+
+
+class FloError(Exception):
+    """Error communicating with the Flo cloud service"""
+
+
+class FloAuthError(FloError):
+    """Flo rejected the account credentials"""
+
+
+class FloCircuitOpenError(FloError):
+    """Request not attempted since the Flo service is currently failing"""
+
+
+def _endpoint(method, path):
+    """Return the endpoint of a request (path with ids masked), e.g. 'GET /devices/{id}'"""
+    segments = path.split('/')
+    for i in range(1, len(segments) - 1):
+        if segments[i] in ID_RESOURCES:
+            segments[i + 1] = '{id}'
+    return f"{method} {'/'.join(segments)}"
+
+
+def _error_type(ex):
+    if isinstance(ex, aiohttp.ClientResponseError):
+        return f"http_{ex.status}"
+    return type(ex).__name__
+
+
+class FloClient:
+    """Async client for a single Flo account"""
+
+    def __init__(self, email, password, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                 api_base=FLO_V2_API_BASE, auth_url=f"{FLO_V1_API_BASE}/users/auth", token_store=None,
+                 requests_per_minute=None, capture=None, replay=None):
+        self._email = email
+        self._password = password
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._pool_size = pool_size
+
+        # base URLs are overridable so the client can be pointed at a local stand-in server
+        self._api_base = api_base
+        self._auth_url = auth_url
+
+        self._session = None
+        self._closed = False
+
+        # token_store (optional) persists the auth token across restarts
+        self._auth = FloAuth(self._async_authenticate, token_store)
+
+        # requests fail fast (without waiting on timeouts) while the Flo service is down
+        self.breaker = CircuitBreaker()
+
+        # latency, bytes and errors of every call made for this account
+        self.metrics = FloMetrics()
+
+        # optional budget shared by every request made for this account
+        self.rate_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+
+        # optionally capture every response (ResponseCapture), or answer requests from a capture
+        # instead of the Flo cloud (ResponseReplay)
+        self.capture = capture
+        self.replay = replay
+
+        # device_id -> (location_id, macAddress), needed for consumption queries
+        self._device_index = {}
+
+        # single-flight: identical concurrent GET requests share one network call
+        self._inflight = {}
+        self.request_count = 0
+        self.coalesced_count = 0
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self._email}>"
+
+    @property
+    def session(self):
+        """Return the pooled HTTP session for this account (created on first use)"""
+        if self._closed:
+            # a closed client must not silently keep polling Flo with a new pool
+            raise FloError(f"Flo client for {self._email} is closed")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self._timeout,
+                headers={
+                    'User-Agent': FLO_USER_AGENT,
+                    'Accept': 'application/json'
+                }
+            )
+        return self._session
+
+    @property
+    def is_connected(self):
+        """Connection status of client with Flo cloud service."""
+        return self._auth.valid
+
+    @property
+    def user_id(self):
+        return self._auth.user_id
+
+    async def async_close(self):
+        """Close the connection pool for this account (the client can't be used afterwards)"""
+        self._closed = True
+        self._auth.cancel()
+        if self.rate_limiter:
+            self.rate_limiter.cancel()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+        if self.capture:
+            await asyncio.get_running_loop().run_in_executor(None, self.capture.close)
+
+    async def async_load_auth(self):
+        """Restore the persisted auth token (no network), returning True if it is still valid"""
+        return await self._auth.async_load()
+
+    async def async_authenticate(self):
+        """Ensure there is a valid auth token, only logging in if the restored token is missing or expired"""
+        await self._auth.async_token()
+
+    async def async_login(self):
+        """Login to the Flo account and generate a new access token"""
+        await self._auth.async_reauth()
+
+    async def _async_authenticate(self):
+        """Login with the account credentials, returning (token, lifetime, user_id)"""
+        if self.replay:
+            return REPLAY_TOKEN, REPLAY_TOKEN_LIFETIME, self.replay.user_id
+
+        LOG.debug(f"Authenticating Flo account {self._email} via {self._auth_url}")
+        payload = {'username': self._email, 'password': self._password}
+        if self.rate_limiter:
+            await self.rate_limiter.async_acquire(PRIORITY_COMMAND)
+
+        self._check_circuit(ENDPOINT_AUTH)
+        started = time.monotonic()
+        try:
+            async with self.session.post(self._auth_url, json=payload) as response:
+                self._record_response(response.status)
+                if response.status in (400, 401, 403):
+                    error = f"http_{response.status}"
+                    self.metrics.record_call(ENDPOINT_AUTH, time.monotonic() - started, error=error)
+                    raise FloAuthError(f"Failed authenticating Flo user {self._email}")
+                response.raise_for_status()
+                data = await response.json()
+                self.metrics.record_call(ENDPOINT_AUTH, time.monotonic() - started, len(await response.read()))
+        except aiohttp.ClientResponseError as ex:
+            self.metrics.record_call(ENDPOINT_AUTH, time.monotonic() - started, error=_error_type(ex))
+            raise FloError(f"Unable to connect to Flo service: {ex}") from ex
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            self.metrics.record_call(ENDPOINT_AUTH, time.monotonic() - started, error=_error_type(ex))
+            self.breaker.record_failure()
+            raise FloError(f"Unable to connect to Flo service: {ex}") from ex
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+
+        if 'token' not in data:
+            raise FloAuthError(f"Failed authenticating Flo user {self._email}")
+
+        return data['token'], int(data['tokenExpiration']), data['tokenPayload']['user']['user_id']
+
+    def _check_circuit(self, endpoint):
+        if not self.breaker.allow_request():
+            self.metrics.record_call(endpoint, None, error=ERROR_CIRCUIT_OPEN)
+            raise FloCircuitOpenError(
+                f"Flo service unavailable, next attempt in {self.breaker.retry_in:.0f}s")
+
+    def _record_response(self, status):
+        """Any response other than a server error shows the Flo service is up"""
+        if status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    async def _async_request(self, method, path, params=None, json=None, priority=None):
+        """Make a request to the Flo v2 API and return the decoded JSON.
+
+        Concurrent identical GET requests (same path, params and priority) are coalesced
+        into a single network call whose result is shared by all callers (so callers must
+        not mutate it). Commands (POST) are never coalesced.
+
+        When rate limited, commands are sent ahead of queued reads unless another priority is given.
+        """
+        # fail fast (before waiting for a token or request budget) while the Flo service is down
+        if self.breaker.state == STATE_OPEN:
+            self.metrics.record_call(_endpoint(method, path), None, error=ERROR_CIRCUIT_OPEN)
+            raise FloCircuitOpenError(
+                f"Flo service unavailable, next attempt in {self.breaker.retry_in:.0f}s")
+
+        if priority is None:
+            priority = PRIORITY_TELEMETRY if method == METHOD_GET else PRIORITY_COMMAND
+
+        if method != METHOD_GET:
+            return await self._async_send(method, path, params, json, priority)
+
+        # a call never joins a request of a lower priority, which may still be queued behind it
+        key = (path, tuple(sorted((params or {}).items())), priority)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced_count += 1
+            # shield so that a cancelled caller does not cancel the request shared with others
+            return await asyncio.shield(inflight)
+
+        inflight = asyncio.ensure_future(self._async_send(method, path, params, json, priority))
+        self._inflight[key] = inflight
+        try:
+            return await asyncio.shield(inflight)
+        finally:
+            if self._inflight.get(key) is inflight:
+                del self._inflight[key]
+
+    @property
+    def coalescing_stats(self):
+        """Counters of network requests made and of calls saved by request coalescing"""
+        return {
+            'requests': self.request_count,
+            'coalesced': self.coalesced_count
+        }
+
+    async def _async_send(self, method, path, params=None, json=None, priority=PRIORITY_TELEMETRY,
+                          retry_auth=True):
+        """Make an authenticated request to the Flo v2 API and return the decoded JSON"""
+        token = await self._auth.async_token()
+        if self.rate_limiter:
+            await self.rate_limiter.async_acquire(priority)
+        self.request_count += 1
+
+        url = f"{self._api_base}{path}"
+        headers = {'authorization': token}
+        endpoint = _endpoint(method, path)
+
+        LOG.debug("Query: %s %s", method, url)
+        self._check_circuit(endpoint)
+        if self.replay:
+            return self._replay_response(method, path, params, endpoint)
+
+        started = time.monotonic()
+        try:
+            async with self.session.request(method, url, params=params, json=json, headers=headers) as response:
+                self._record_response(response.status)
+                if response.status != 401 or not retry_auth:
+                    response.raise_for_status()
+                    body = await response.read()
+                    self.metrics.record_call(endpoint, time.monotonic() - started, len(body))
+                    data = await response.json(content_type=None)
+                    if self.capture:
+                        self.capture.write(method, path, params, response.status, data)
+                    return data
+                self.metrics.record_call(endpoint, time.monotonic() - started, error='http_401')
+        except aiohttp.ClientResponseError as ex:
+            self.metrics.record_call(endpoint, time.monotonic() - started, error=_error_type(ex))
+            if self.capture:
+                self.capture.write(method, path, params, ex.status, None)
+            # never format the request info, its headers hold the auth token
+            raise FloError(f"Error querying {method} {url}: status {ex.status} {ex.message}") from ex
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            self.metrics.record_call(endpoint, time.monotonic() - started, error=_error_type(ex))
+            self.breaker.record_failure()
+            raise FloError(f"Error querying {method} {url}: {type(ex).__name__} {ex}") from ex
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+
+        # token was rejected: concurrent requests rejected with the same token share one re-login
+        await self._auth.async_reauth(stale_token=token)
+        return await self._async_send(method, path, params, json, priority, retry_auth=False)
+
+    def _replay_response(self, method, path, params, endpoint):
+        """Return the captured response for a request (see capture.py)"""
+        response = self.replay.response(method, path, params)
+        if response is None:
+            self.metrics.record_call(endpoint, 0.0, error='not_captured')
+            raise FloError(f"No captured response to replay for {method} {path}")
+
+        status, data = response
+        self._record_response(status)
+        if status >= 400:
+            self.metrics.record_call(endpoint, 0.0, error=f"http_{status}")
+            raise FloError(f"Error querying {method} {path}: replayed status {status}")
+
+        self.metrics.record_call(endpoint, 0.0)
+        return data
+
+    async def async_locations(self):
+        """Return all locations (with devices) registered with the Flo account"""
+        await self._auth.async_token()
+
+        data = await self._async_request(METHOD_GET, f"/users/{self._auth.user_id}", params={'expand': 'locations'})
+        locations = data.get('locations', []) if data else []
+
+        for location in locations:
+            for device in location.get('devices', []):
+                self._device_index[device['id']] = (location['id'], device.get('macAddress'))
+        return locations
+
+    async def async_location(self, location_id):
+        """Return details on all devices at a location"""
+        return await self._async_request(METHOD_GET, f"/locations/{location_id}", params={'expand': 'devices'})
+
+    async def async_device(self, device_id, priority=None):
+        return await self._async_request(METHOD_GET, f"/devices/{device_id}", priority=priority)
+
+    async def async_open_valve(self, device_id):
+        LOG.debug(f"Opening valve for device {device_id}")
+        return await self._async_request(METHOD_POST, f"/devices/{device_id}", json={'valve': {'target': 'open'}})
+
+    async def async_close_valve(self, device_id):
+        LOG.debug(f"Closing valve for device {device_id}")
+        return await self._async_request(METHOD_POST, f"/devices/{device_id}", json={'valve': {'target': 'closed'}})
+
+    async def async_run_health_test(self, device_id):
+        """Run the health test for the specified Flo device"""
+        return await self._async_request(METHOD_POST, f"/devices/{device_id}/healthTest/run")
+
+    async def async_set_mode(self, location_id, mode):
+        params = {'target': mode}
+        if mode == 'sleep':
+            # sleep for 8 hours, then revert to home mode
+            params['revertMinutes'] = 480
+            params['revertMode'] = 'home'
+        return await self._async_request(METHOD_POST, f"/locations/{location_id}/systemMode", json=params)
+
+    async def async_consumption(self, device_id, start_date=None, end_date=None, interval=INTERVAL_HOURLY,
+                                priority=PRIORITY_CONSUMPTION):
+        """Return consumption data for a given device id (defaults to today in LOCAL timezone).
+
+        Dates may be naive local times or timezone aware, and are sent to Flo in UTC.
+        """
+        if device_id not in self._device_index:
+            await self.async_locations()
+        location_id, mac_address = self._device_index.get(device_id, (None, None))
+
+        now = datetime.now()
+        if not start_date:
+            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if not end_date:
+            # Flo website queries for current data sets end timestamp as the last millisecond of the day
+            end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+        params = {
+            'locationId': location_id,
+            'macAddress': mac_address,
+            'startDate': flo_time(start_date),
+            'endDate': flo_time(end_date),
+            'interval': interval
+        }
+        return await self._async_request(METHOD_GET, '/water/consumption', params=params, priority=priority)
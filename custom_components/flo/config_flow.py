@@ -1,13 +1,13 @@
 """Config flow for Flo integration."""
 import logging
 
-from pyflowater import PyFlo
 import voluptuous as vol
 
-from homeassistant import config_entries, core
+from homeassistant import config_entries, core, exceptions
 from homeassistant.const import CONF_EMAIL, CONF_PASSWORD, CONF_TIMEOUT
 
-from .const import FLO_DOMAIN  # pylint:disable=unused-import; pylint:disable=unused-import
+from .client import FloClient, FloError, FloAuthError
+from .const import FLO_DOMAIN, ATTR_YAML_CONFIG, CONF_REPLAY  # pylint:disable=unused-import
 
 LOG = logging.getLogger(__name__)
 
@@ -22,6 +22,15 @@ async def validate_input(hass: core.HomeAssistant, data):
     """Validate the user input allows us to connect.
     Data has the keys from DATA_SCHEMA with values provided by the user.
     """
+    flo = FloClient(data[CONF_EMAIL], data[CONF_PASSWORD])
+    try:
+        await flo.async_login()
+    except FloAuthError as ex:
+        raise InvalidAuth from ex
+    except FloError as ex:
+        raise CannotConnect from ex
+    finally:
+        await flo.async_close()
 
     # Return info that you want to store in the config entry.
     return {"title": data[CONF_EMAIL]}
@@ -37,10 +46,15 @@ class ConfigFlow(config_entries.ConfigFlow, domain=FLO_DOMAIN):
         """Handle the initial step."""
         errors = {}
         if user_input is not None:
+            await self.async_set_unique_id(user_input[CONF_EMAIL])
+            self._abort_if_unique_id_configured(updates=user_input)
             try:
                 info = await validate_input(self.hass, user_input)
-                await self.async_set_unique_id(user_input[CONF_EMAIL])
                 return self.async_create_entry(title=info["title"], data=user_input)
+            except CannotConnect:
+                errors["base"] = "cannot_connect"
+            except InvalidAuth:
+                errors["base"] = "invalid_auth"
             except Exception:  # pylint: disable=broad-except
                 LOG.exception("Unexpected exception")
                 errors["base"] = "unknown"
@@ -50,8 +64,23 @@ class ConfigFlow(config_entries.ConfigFlow, domain=FLO_DOMAIN):
         )
 
     async def async_step_import(self, user_input):
-        """Handle import."""
+        """Handle import of the credentials from configuration.yaml."""
         await self.async_set_unique_id(user_input[CONF_EMAIL])
-        self._abort_if_unique_id_configured()
+
+        # changed credentials in configuration.yaml update (and reload) the existing entry
+        self._abort_if_unique_id_configured(updates=user_input)
+
+        # replayed responses come from a capture, so there are no live credentials to validate
+        yaml_config = self.hass.data.get(FLO_DOMAIN, {}).get(ATTR_YAML_CONFIG, {})
+        if CONF_REPLAY in yaml_config:
+            return self.async_create_entry(title=user_input[CONF_EMAIL], data=user_input)
 
         return await self.async_step_user(user_input)
+
+
+class CannotConnect(exceptions.HomeAssistantError):
+    """Error to indicate we cannot connect."""
+
+
+class InvalidAuth(exceptions.HomeAssistantError):
+    """Error to indicate there is invalid auth."""
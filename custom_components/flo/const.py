@@ -6,12 +6,29 @@ FLO_DOMAIN = 'flo'
 ATTRIBUTION = "Data by Flo"
 
 ATTR_CACHE = 'cache'
-ATTR_COORDINATOR = 'coordinator'
+ATTR_SCHEDULER = 'scheduler'
+ATTR_DEADBANDS = 'deadbands'
+ATTR_MAX_SILENCE = 'max_silence'
+ATTR_LOCATIONS = 'locations'
+ATTR_YAML_CONFIG = 'yaml_config'
+
+CONF_REPLAY = 'replay'
+ATTR_UNSUBSCRIBE = 'unsubscribe'
+ATTR_VALVES = 'valves'
+ATTR_MODE_SENSORS = 'mode_sensors'
+ATTR_ENTITIES = 'entities'
+
+# valve targets of Flo valve commands
+VALVE_OPEN = 'open'
+VALVE_CLOSED = 'closed'
 
 ICON_FLOW_RATE='mdi:water-pump'
 ICON_TEMP='mdi:thermometer'
 ICON_CONSUMPTION='mdi:gauge'
 ICON_PRESSURE='mdi:gauge'
 ICON_MONITORING='mdi:shield-search'
+ICON_API_BUDGET='mdi:speedometer'
+ICON_API_LATENCY='mdi:timer-outline'
+ICON_API_CALLS='mdi:swap-vertical'
 ICON_VALVE_OPEN='mdi:valve-open'
 ICON_VALVE_CLOSED='mdi:valve-closed'
\ No newline at end of file
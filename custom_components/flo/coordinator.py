@@ -0,0 +1,560 @@
+"""
+Refresh logic and polling scheduler used by the Flo integration.
+
+Each class of Flo data is refreshed by its own update coordinator at its own cadence
+and only queries the Flo endpoints it needs:
+
+- telemetry:   device endpoint (flow rate, pressure, temperature and valve state)
+- mode:        user locations endpoint (location systemMode and device list)
+- consumption: consumption endpoint for today's rollup
+- yearly:      daily rollup store (closed days of the year)
+
+Every telemetry refresh also feeds the per-device rolling statistics and leak detectors.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .client import FloError, FloCircuitOpenError, DEFAULT_POOL_SIZE
+from .metrics import current_data_class
+from .ratelimit import PRIORITY_COMMAND
+from .const import FLO_DOMAIN
+from .diff import ChangeTracker
+from .model import DeviceSnapshot, LocationSnapshot
+from .rollup import DailyConsumptionStore
+from .telemetry import TelemetryBuffer, MAX_CAPACITY, MAX_VALID_TEMP_F
+from .leak import LeakDetector
+
+LOG = logging.getLogger(__name__)
+
+# max concurrent device requests per refresh, as many as the connection pool serves at once
+DEFAULT_MAX_CONCURRENCY = DEFAULT_POOL_SIZE
+
+DATA_CLASS_TELEMETRY = 'telemetry'
+DATA_CLASS_MODE = 'mode'
+DATA_CLASS_CONSUMPTION = 'consumption'
+DATA_CLASS_YEARLY = 'yearly'
+
+SIGNAL_AVAILABILITY = 'flo_availability_{}_{}'
+
+# sent after every telemetry refresh, even when no field changed (interval, rolling statistics)
+SIGNAL_TELEMETRY_CYCLE = 'flo_telemetry_cycle_{}'
+
+# sent (with the device id) to close the valve of a device with a detected leak
+SIGNAL_LEAK_SHUTOFF = 'flo_leak_shutoff_{}'
+EVENT_LEAK_DETECTED = 'flo_leak_detected'
+
+# last-known data is persisted so entities can be created at startup without waiting on Flo
+SNAPSHOT_STORAGE_VERSION = 3  # 2: compact device/location snapshots instead of raw payloads, 3: dated totals
+SNAPSHOT_STORAGE_KEY = f"{FLO_DOMAIN}.snapshot"
+SNAPSHOT_SAVE_DELAY = 60  # seconds
+
+ATTR_LOCATION_IDS = 'location_ids'
+ATTR_DEVICES = 'devices'
+ATTR_CACHE = 'cache'
+ATTR_CONSUMPTION = 'consumption'
+ATTR_CLOSED_TOTALS = 'closed_totals'
+
+# fields of the per-device values kept outside the raw payload cache
+FIELD_CONSUMPTION = ('consumption',)
+FIELD_CLOSED_TOTAL = ('closed_total',)
+FIELD_LEAK = ('leak',)
+
+# consumption and closed totals are stored with the (local) date they were computed for,
+# so totals computed on either side of midnight are never combined
+ATTR_DATE = 'date'
+ATTR_GALLONS = 'gallons'
+
+# try to avoid DDoS Flo's cloud service
+DEFAULT_SCAN_INTERVALS = {
+    DATA_CLASS_TELEMETRY: timedelta(seconds=30),
+    DATA_CLASS_MODE: timedelta(minutes=5),
+    DATA_CLASS_CONSUMPTION: timedelta(minutes=10),
+    DATA_CLASS_YEARLY: timedelta(hours=1)
+}
+
+# adaptive telemetry polling: fast while water flows or a valve move is pending, backing off when idle
+DEFAULT_ADAPTIVE_MIN_INTERVAL = timedelta(seconds=10)
+DEFAULT_ADAPTIVE_MAX_INTERVAL = timedelta(minutes=5)
+ADAPTIVE_BACKOFF = 2
+
+# after a valve command the device is polled at this interval until the valve reports the target state
+VALVE_CONFIRM_INTERVAL = timedelta(seconds=2)
+VALVE_CONFIRM_TIMEOUT = timedelta(seconds=60)
+
+# window of recent telemetry samples kept per device for rolling statistics
+DEFAULT_STATS_WINDOW = timedelta(hours=1)
+
+
+class AdaptiveInterval:
+    """Polling interval that drops to min_interval when active and backs off exponentially when idle"""
+
+    def __init__(self, min_interval, max_interval, initial_interval, backoff=ADAPTIVE_BACKOFF):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min(max(initial_interval, self.min_interval), self.max_interval)
+        self._backoff = backoff
+
+    def next(self, active):
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self._backoff, self.max_interval)
+        return self.interval
+
+
+def is_device_active(device):
+    """Return True if water is flowing or a valve move is pending for the device snapshot"""
+    if not device:
+        return False
+
+    if device.gpm:
+        return True
+
+    return bool(device.valve_target) and device.valve_target != device.valve_last_known
+
+
+async def _async_gather_bounded(ids, fetch, max_concurrency):
+    """Call fetch(id) concurrently for all ids (bounded by max_concurrency).
+
+    A failure for one id is logged and isolated from the others. Returns the list of ids that failed.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded_fetch(id):
+        async with semaphore:
+            try:
+                await fetch(id)
+            except FloCircuitOpenError as ex:
+                # already reported when the circuit opened, so avoid a warning per id per cycle
+                LOG.debug(f"Skipped updating Flo data for {id}: {ex}")
+                return id
+            except FloError as ex:
+                LOG.warning(f"Failed updating Flo data for {id}, keeping previous data: {ex}")
+                return id
+        return None
+
+    results = await asyncio.gather(*[bounded_fetch(id) for id in ids])
+    return [id for id in results if id]
+
+
+def _store(cache, id, payload, tracker):
+    if tracker:
+        tracker.update(cache, id, payload)
+    else:
+        cache[id] = payload
+
+
+async def async_refresh_devices(flo, cache, device_ids, max_concurrency=DEFAULT_MAX_CONCURRENCY, tracker=None):
+    """Fetch all devices concurrently (bounded by max_concurrency) into the cache as snapshots.
+
+    A failure for one device keeps that device's previous snapshot in the cache
+    instead of failing the whole refresh. Returns the list of device ids that failed.
+    """
+    async def fetch(device_id):
+        data = await flo.async_device(device_id)
+        if data:
+            _store(cache, device_id, DeviceSnapshot.from_payload(data), tracker)
+
+    return await _async_gather_bounded(device_ids, fetch, max_concurrency)
+
+
+async def async_refresh_locations(flo, cache, tracker=None):
+    """Refresh all locations into the cache and return the ids of the locations and of all their devices"""
+    location_ids = []
+    device_ids = []
+    for payload in await flo.async_locations():
+        location = LocationSnapshot.from_payload(payload)
+        _store(cache, location.id, location, tracker)
+        location_ids.append(location.id)
+        device_ids.extend(location.device_ids)
+    return location_ids, device_ids
+
+
+async def async_refresh(flo, cache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Refresh all locations and then all devices across all locations at once"""
+    _, device_ids = await async_refresh_locations(flo, cache)
+
+    failed = await async_refresh_devices(flo, cache, device_ids, max_concurrency)
+    if device_ids and len(failed) == len(device_ids):
+        raise FloError(f"Failed updating all {len(device_ids)} Flo devices")
+    return failed
+
+
+class FloScheduler:
+    """Owns one update coordinator per Flo data class, each polling at its own interval"""
+
+    def __init__(self, hass, flo, scan_intervals=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 adaptive_bounds=None, storage_id=None, stats_window=DEFAULT_STATS_WINDOW,
+                 leak_thresholds=None, leak_auto_close=False):
+        self._hass = hass
+        self._storage_id = storage_id
+        self._flo = flo
+        self._max_concurrency = max_concurrency
+        self._device_ids = []
+
+        # location and device snapshots keyed by id
+        self.cache = {}
+
+        # device_id -> gallons consumed today / during the closed days of this year
+        self.consumption = {}
+        self.closed_totals = {}
+
+        # storage is kept per Flo account (config entry)
+        snapshot_key = f"{SNAPSHOT_STORAGE_KEY}.{storage_id}" if storage_id else SNAPSHOT_STORAGE_KEY
+        self._snapshot_store = Store(hass, SNAPSHOT_STORAGE_VERSION, snapshot_key)
+        self.rollup = DailyConsumptionStore(hass, flo, storage_id)
+        self._location_ids = []
+
+        # only entities whose source fields changed are notified after a refresh
+        self._tracker = ChangeTracker()
+        self._last_success = {}
+
+        intervals = {**DEFAULT_SCAN_INTERVALS, **(scan_intervals or {})}
+
+        # optional (min_interval, max_interval) bounds enable adaptive telemetry polling
+        self._adaptive = None
+        if adaptive_bounds:
+            min_interval, max_interval = adaptive_bounds
+            self._adaptive = AdaptiveInterval(min_interval, max_interval, intervals[DATA_CLASS_TELEMETRY])
+            intervals[DATA_CLASS_TELEMETRY] = self._adaptive.interval
+
+        # device_id -> recent telemetry samples, sized to hold the window at the fastest polling interval
+        self.telemetry_history = {}
+        self._stats_window = stats_window.total_seconds()
+        fastest = self._adaptive.min_interval if self._adaptive else intervals[DATA_CLASS_TELEMETRY]
+        self._stats_capacity = min(MAX_CAPACITY, int(self._stats_window / max(fastest.total_seconds(), 1)) + 1)
+
+        # device_id -> local leak detector, and the leak currently detected (or None)
+        self.leak_detectors = {}
+        self.leaks = {}
+        self._leak_thresholds = leak_thresholds
+        self._leak_auto_close = leak_auto_close
+
+        # device_id -> latest valve command still being confirmed
+        self._valve_commands = {}
+
+        update_methods = {
+            DATA_CLASS_TELEMETRY: self._async_update_telemetry,
+            DATA_CLASS_MODE: self._async_update_locations,
+            DATA_CLASS_CONSUMPTION: self._async_update_consumption,
+            DATA_CLASS_YEARLY: self._async_update_yearly
+        }
+
+        self.coordinators = {
+            data_class: DataUpdateCoordinator(
+                hass, LOG,
+                name=f"Flo {data_class}",
+                update_method=self._instrumented(data_class, update_method),
+                update_interval=intervals[data_class]
+            )
+            for data_class, update_method in update_methods.items()
+        }
+
+        # entities subscribe to field change signals instead of the coordinators, so the
+        # scheduler is the single listener that keeps each coordinator polling
+        self._unsubscribe = [
+            coordinator.async_add_listener(self._async_dispatch_changes_callback(data_class))
+            for data_class, coordinator in self.coordinators.items()
+        ]
+
+    def _instrumented(self, data_class, update_method):
+        """Wrap a refresh to record its duration and attribute its Flo calls to the data class"""
+        async def async_update():
+            context = current_data_class.set(data_class)
+            started = time.monotonic()
+            failed = True
+            try:
+                result = await update_method()
+                failed = False
+                return result
+            finally:
+                current_data_class.reset(context)
+                self._flo.metrics.record_refresh(data_class, time.monotonic() - started, failed)
+        return async_update
+
+    def availability_signal(self, data_class):
+        """Return the dispatcher signal sent when the availability of a data class changes"""
+        return SIGNAL_AVAILABILITY.format(id(self), data_class)
+
+    @property
+    def telemetry_cycle_signal(self):
+        """Return the dispatcher signal sent after every telemetry refresh"""
+        return SIGNAL_TELEMETRY_CYCLE.format(id(self))
+
+    async def async_stop(self):
+        """Stop polling and persist the latest snapshot"""
+        for unsubscribe in self._unsubscribe:
+            unsubscribe()
+        self._unsubscribe = []
+
+        if self._location_ids:
+            await self._snapshot_store.async_save(self._snapshot())
+
+    def _async_dispatch_changes_callback(self, data_class):
+        @callback
+        def async_dispatch_changes():
+            coordinator = self.coordinator(data_class)
+            if self._last_success.get(data_class) != coordinator.last_update_success:
+                self._last_success[data_class] = coordinator.last_update_success
+                async_dispatcher_send(self._hass, self.availability_signal(data_class))
+
+            self._async_send_field_signals()
+
+            if data_class == DATA_CLASS_TELEMETRY:
+                async_dispatcher_send(self._hass, self.telemetry_cycle_signal)
+        return async_dispatch_changes
+
+    @callback
+    def _async_send_field_signals(self):
+        """Notify the entities whose source fields changed since the last notification"""
+        signals = self._tracker.pop_signals()
+        for signal in signals:
+            async_dispatcher_send(self._hass, signal)
+
+        if signals:
+            self._snapshot_store.async_delay_save(self._snapshot, SNAPSHOT_SAVE_DELAY)
+
+    def coordinator(self, data_class):
+        return self.coordinators[data_class]
+
+    @property
+    def metrics(self):
+        """Metrics of the Flo calls and refreshes of this account"""
+        return self._flo.metrics
+
+    @property
+    def location_ids(self):
+        return self._location_ids
+
+    @property
+    def device_ids(self):
+        return self._device_ids
+
+    async def async_load(self):
+        """Load the rollup store and restore the last-known snapshot, returning True if one was restored"""
+        await self.rollup.async_load()
+
+        try:
+            snapshot = await self._snapshot_store.async_load()
+        except NotImplementedError:
+            # snapshot of raw payloads saved by an older version, just start cold
+            snapshot = None
+        if not snapshot or not snapshot.get(ATTR_LOCATION_IDS):
+            return False
+
+        self._location_ids = snapshot[ATTR_LOCATION_IDS]
+        self._device_ids = snapshot[ATTR_DEVICES]
+        for id, data in snapshot[ATTR_CACHE].items():
+            snapshot_class = DeviceSnapshot if id in self._device_ids else LocationSnapshot
+            self.cache[id] = snapshot_class.from_dict(data)
+        self.consumption.update(snapshot[ATTR_CONSUMPTION])
+        self.closed_totals.update(snapshot[ATTR_CLOSED_TOTALS])
+
+        # live refreshes are compared against the restored data, so only changed fields notify entities
+        return True
+
+    def _snapshot(self):
+        return {
+            ATTR_LOCATION_IDS: self._location_ids,
+            ATTR_DEVICES: self._device_ids,
+            ATTR_CACHE: {id: snapshot.as_dict() for id, snapshot in self.cache.items()},
+            ATTR_CONSUMPTION: self.consumption,
+            ATTR_CLOSED_TOTALS: self.closed_totals
+        }
+
+    async def async_refresh_all(self):
+        """Refresh every data class once (locations first, since all other classes need the device list)"""
+        await self.coordinator(DATA_CLASS_MODE).async_refresh()
+        await asyncio.gather(*[
+            coordinator.async_refresh()
+            for data_class, coordinator in self.coordinators.items() if data_class != DATA_CLASS_MODE
+        ])
+
+    async def async_confirm_valve(self, device_id, target, interval=VALVE_CONFIRM_INTERVAL,
+                                  timeout=VALVE_CONFIRM_TIMEOUT):
+        """Poll only this device at a short interval until its valve reports the target state.
+
+        Returns True once confirmed, False on timeout, or None if superseded by a newer command.
+        """
+        command = self._valve_commands[device_id] = object()
+        deadline = time.monotonic() + timeout.total_seconds()
+        try:
+            while True:
+                try:
+                    data = await self._flo.async_device(device_id, priority=PRIORITY_COMMAND)
+                    if data:
+                        self._tracker.update(self.cache, device_id, DeviceSnapshot.from_payload(data))
+                        self._async_send_field_signals()
+                        self._async_wake_telemetry()
+                except FloError as ex:
+                    LOG.debug(f"Failed confirming valve of Flo device {device_id}: {ex}")
+
+                if self._valve_commands.get(device_id) is not command:
+                    return None
+
+                device = self.cache.get(device_id)
+                if device and device.valve_last_known == target:
+                    return True
+
+                if time.monotonic() + interval.total_seconds() > deadline:
+                    return False
+                await asyncio.sleep(interval.total_seconds())
+        finally:
+            if self._valve_commands.get(device_id) is command:
+                del self._valve_commands[device_id]
+
+    async def async_raw_payloads(self):
+        """Fetch the complete Flo payloads for all locations and devices (for diagnostics only)"""
+        payloads = {location['id']: location for location in await self._flo.async_locations()}
+        device_ids = await self._async_device_ids()
+        for device_id, payload in zip(device_ids, await asyncio.gather(*[
+                self._flo.async_device(device_id) for device_id in device_ids])):
+            payloads[device_id] = payload
+        return payloads
+
+    async def _async_device_ids(self):
+        """Return all known device ids, loading the locations if they were never fetched"""
+        if not self._device_ids:
+            await self._async_update_locations()
+        return self._device_ids
+
+    async def _async_update_locations(self):
+        try:
+            self._location_ids, self._device_ids = await async_refresh_locations(
+                self._flo, self.cache, self._tracker)
+        except FloError as ex:
+            raise UpdateFailed(f"Error updating Flo locations: {ex}") from ex
+
+    async def _async_update_devices(self):
+        device_ids = await self._async_device_ids()
+
+        # query Flo webservice for all devices across all locations concurrently
+        failed = await async_refresh_devices(
+            self._flo, self.cache, device_ids, self._max_concurrency, self._tracker)
+        if device_ids and len(failed) == len(device_ids):
+            raise UpdateFailed(f"Failed updating all {len(device_ids)} Flo devices")
+        return failed
+
+    def _device_modes(self):
+        """Return the monitoring mode of the location of each device"""
+        modes = {}
+        for location_id in self._location_ids:
+            location = self.cache.get(location_id)
+            if location:
+                for device_id in location.device_ids:
+                    modes[device_id] = location.system_mode
+        return modes
+
+    def _record_telemetry(self, failed):
+        """Add the freshly refreshed telemetry of each device to its rolling window and leak detector"""
+        now = time.time()
+        modes = self._device_modes()
+        for device_id in self._device_ids:
+            device = self.cache.get(device_id)
+            if not device or device_id in failed:
+                continue
+
+            history = self.telemetry_history.get(device_id)
+            if history is None:
+                history = self.telemetry_history[device_id] = TelemetryBuffer(
+                    self._stats_window, self._stats_capacity)
+
+            temp_f = device.temp_f
+            if temp_f is not None and temp_f > MAX_VALID_TEMP_F:
+                temp_f = None
+            history.add(now, device.gpm, device.psi, temp_f)
+
+            detector = self.leak_detectors.get(device_id)
+            if detector is None:
+                detector = self.leak_detectors[device_id] = LeakDetector(self._leak_thresholds)
+
+            valve_closed = device.valve_last_known == 'closed'
+            leak = detector.add(now, device.gpm, device.psi, valve_closed, modes.get(device_id))
+            if self._tracker.update(self.leaks, device_id, leak, FIELD_LEAK) and leak:
+                self._leak_detected(device, detector, modes.get(device_id), valve_closed)
+
+    def _leak_detected(self, device, detector, mode, valve_closed):
+        LOG.warning(f"Leak ({detector.leak}) detected for Flo device {device.id} in {mode} mode")
+        self._hass.bus.async_fire(EVENT_LEAK_DETECTED, {
+            'device_id': device.id,
+            'reason': detector.leak,
+            'mode': mode,
+            'flow_duration': round(detector.flow_duration),
+            'pressure_drop': round(detector.pressure_drop, 1),
+            'gpm': device.gpm,
+            'psi': device.psi
+        })
+
+        if self._leak_auto_close and not valve_closed:
+            LOG.warning(f"Closing valve of Flo device {device.id} due to detected leak")
+            async_dispatcher_send(self._hass, SIGNAL_LEAK_SHUTOFF.format(device.id))
+
+    async def _async_update_telemetry(self):
+        try:
+            failed = await self._async_update_devices()
+            self._record_telemetry(failed)
+        finally:
+            if self._adaptive:
+                # takes effect when the coordinator schedules its next refresh
+                self.coordinator(DATA_CLASS_TELEMETRY).update_interval = self._adaptive.next(self._is_active())
+
+    def _is_active(self):
+        return any(is_device_active(self.cache.get(device_id)) for device_id in self._device_ids)
+
+    def _async_wake_telemetry(self):
+        """After a device refresh outside of telemetry, stop any backoff if water is flowing.
+
+        Telemetry is refreshed right away (at the minimum interval from then on) so the leak
+        detectors see the flow without waiting out the backed off interval.
+        """
+        coordinator = self.coordinator(DATA_CLASS_TELEMETRY)
+        if not self._adaptive or coordinator.update_interval <= self._adaptive.min_interval:
+            return
+        if self._is_active():
+            coordinator.update_interval = self._adaptive.next(True)
+            self._hass.async_create_task(coordinator.async_request_refresh())
+
+    @property
+    def telemetry_interval(self):
+        """Current effective telemetry polling interval"""
+        return self.coordinator(DATA_CLASS_TELEMETRY).update_interval
+
+    async def _async_update_consumption(self):
+        today = datetime.now().date()
+
+        async def fetch(device_id):
+            # consumption is the rollup since the beginning of today
+            data = await self._flo.async_consumption(
+                device_id, start_date=datetime.combine(today, datetime.min.time()),
+                end_date=datetime.combine(today, datetime.max.time()))
+            if data:
+                total = {ATTR_DATE: today.isoformat(), ATTR_GALLONS: data['aggregations']['sumTotalGallonsConsumed']}
+                self._tracker.update(self.consumption, device_id, total, FIELD_CONSUMPTION)
+
+        device_ids = await self._async_device_ids()
+        failed = await _async_gather_bounded(device_ids, fetch, self._max_concurrency)
+        if device_ids and len(failed) == len(device_ids):
+            raise UpdateFailed(f"Failed updating consumption for all {len(device_ids)} Flo devices")
+
+        # after midnight, close yesterday right away rather than at the next yearly refresh
+        if any((self.closed_totals.get(device_id) or {}).get(ATTR_DATE) != today.isoformat()
+               for device_id in device_ids):
+            self._hass.async_create_task(self.coordinator(DATA_CLASS_YEARLY).async_request_refresh())
+
+    async def _async_update_yearly(self):
+        async def fetch(device_id):
+            today, total = await self.rollup.async_closed_total(device_id)
+            total = {ATTR_DATE: today.isoformat(), ATTR_GALLONS: total}
+            self._tracker.update(self.closed_totals, device_id, total, FIELD_CLOSED_TOTAL)
+
+        device_ids = await self._async_device_ids()
+        failed = await _async_gather_bounded(device_ids, fetch, self._max_concurrency)
+        if device_ids and len(failed) == len(device_ids):
+            raise UpdateFailed(f"Failed updating yearly consumption for all {len(device_ids)} Flo devices")
@@ -0,0 +1,55 @@
+"""
+Diagnostics download for a Flo account (config entry): call metrics, client health,
+the cached snapshots and the complete (redacted) Flo payloads.
+"""
+import logging
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.const import CONF_EMAIL, CONF_PASSWORD
+
+from .client import FloError
+from .const import FLO_DOMAIN, ATTR_SCHEDULER, ATTR_LOCATIONS
+from . import FLO_SERVICE
+
+LOG = logging.getLogger(__name__)
+
+# account and home identifying fields of the Flo payloads
+TO_REDACT = {
+    CONF_EMAIL, CONF_PASSWORD, 'token', 'macAddress', 'serialNumber', 'address', 'address2',
+    'city', 'postalCode', 'geoLocation', 'firstName', 'lastName', 'phoneMobile'
+}
+
+
+async def async_get_config_entry_diagnostics(hass, entry):
+    """Return diagnostics for a Flo config entry"""
+    flo_data = hass.data[FLO_DOMAIN][entry.entry_id]
+    flo = flo_data[FLO_SERVICE]
+    scheduler = flo_data[ATTR_SCHEDULER]
+
+    try:
+        payloads = await scheduler.async_raw_payloads()
+    except FloError as ex:
+        LOG.warning(f"Unable to fetch Flo payloads for diagnostics: {ex}")
+        payloads = {'error': str(ex)}
+
+    return {
+        'entry': async_redact_data(dict(entry.data), TO_REDACT),
+        'locations': flo_data[ATTR_LOCATIONS],
+        'metrics': flo.metrics.as_dict(),
+        'client': {
+            'breaker': flo.breaker.state,
+            'coalescing': flo.coalescing_stats,
+            'rate_limiter': flo.rate_limiter.stats if flo.rate_limiter else None
+        },
+        'scheduler': {
+            'telemetry_interval': scheduler.telemetry_interval.total_seconds(),
+            'last_update_success': {
+                data_class: coordinator.last_update_success
+                for data_class, coordinator in scheduler.coordinators.items()
+            },
+            'leaks': scheduler.leaks
+        },
+        'snapshots': async_redact_data(
+            {id: snapshot.as_dict() for id, snapshot in scheduler.cache.items()}, TO_REDACT),
+        'payloads': async_redact_data(payloads, TO_REDACT)
+    }
@@ -0,0 +1,70 @@
+"""
+Field-level change tracking for Flo data, so that only the entities whose
+source fields changed are notified after a refresh.
+"""
+from .model import Snapshot
+
+SIGNAL_FIELD_UPDATE = 'flo_update_{}_{}'
+
+
+def diff_paths(old, new, prefix=()):
+    """Return the set of paths (tuples of keys) of the leaf fields that differ between two payloads.
+
+    Dicts are compared key by key; any other values (including lists) are compared as a whole.
+    """
+    if isinstance(old, dict) or isinstance(new, dict):
+        changed = set()
+        if not (isinstance(old, dict) and isinstance(new, dict)) and prefix:
+            changed.add(prefix)
+
+        old = old if isinstance(old, dict) else {}
+        new = new if isinstance(new, dict) else {}
+        for key in old.keys() | new.keys():
+            old_value = old.get(key)
+            new_value = new.get(key)
+            if old_value != new_value:
+                changed |= diff_paths(old_value, new_value, prefix + (key,))
+        return changed
+
+    if old != new:
+        return {prefix}
+    return set()
+
+
+def field_signal(id, path):
+    """Return the dispatcher signal sent when the field at path changes for a Flo device or location"""
+    return SIGNAL_FIELD_UPDATE.format(id, '.'.join(path))
+
+
+def _fields(value):
+    return value.as_dict() if isinstance(value, Snapshot) else value
+
+
+class ChangeTracker:
+    """Stores values into a cache, recording which fields changed since the last notification"""
+
+    def __init__(self):
+        self._pending = {}  # id -> set of changed paths
+
+    def update(self, cache, id, value, path=()):
+        """Store the value (snapshot or single field) for id into the cache, returning False if it is unchanged.
+
+        The optional path prefixes the changed fields, for caches holding a single field per id.
+        """
+        old = cache.get(id)
+        if id in cache and old == value:
+            return False
+
+        cache[id] = value
+        self._pending.setdefault(id, set()).update(diff_paths(_fields(old), _fields(value), path))
+        return True
+
+    def pop_signals(self):
+        """Return the signals for all fields (and their parents) changed since the last call"""
+        signals = set()
+        for id, paths in self._pending.items():
+            for path in paths:
+                for length in range(1, len(path) + 1):
+                    signals.add(field_signal(id, path[:length]))
+        self._pending = {}
+        return signals
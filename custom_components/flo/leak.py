@@ -0,0 +1,80 @@
+"""
+Local leak detection on the polled Flo telemetry.
+
+Each device has a LeakDetector fed every telemetry sample (O(1) time and memory per
+sample), so a leak is detected within a polling interval instead of waiting on
+Flo's cloud alerting. Two conditions are detected, with thresholds depending on
+the location's monitoring mode (home/away/sleep):
+
+- continuous flow: water has been flowing without a break for too long
+- pressure drop:   pressure fell while the valve is closed (water escaping downstream)
+"""
+import logging
+
+LOG = logging.getLogger(__name__)
+
+MODE_HOME = 'home'
+MODE_AWAY = 'away'
+MODE_SLEEP = 'sleep'
+
+LEAK_CONTINUOUS_FLOW = 'continuous_flow'
+LEAK_PRESSURE_DROP = 'pressure_drop'
+
+THRESHOLD_MAX_FLOW_DURATION = 'max_flow_duration'  # seconds
+THRESHOLD_PRESSURE_DROP = 'pressure_drop'  # psi
+
+DEFAULT_THRESHOLDS = {
+    MODE_HOME: {THRESHOLD_MAX_FLOW_DURATION: 7200, THRESHOLD_PRESSURE_DROP: 10.0},
+    MODE_AWAY: {THRESHOLD_MAX_FLOW_DURATION: 600, THRESHOLD_PRESSURE_DROP: 5.0},
+    MODE_SLEEP: {THRESHOLD_MAX_FLOW_DURATION: 1800, THRESHOLD_PRESSURE_DROP: 5.0}
+}
+DEFAULT_FLOW_THRESHOLD = 0.05  # gpm above which water is considered flowing
+
+
+class LeakDetector:
+    """Incremental leak detection for the telemetry samples of a single Flo device"""
+
+    __slots__ = ('_thresholds', '_flow_threshold', 'flow_started', 'flow_duration',
+                 'closed_psi', 'pressure_drop', 'leak')
+
+    def __init__(self, thresholds=None, flow_threshold=DEFAULT_FLOW_THRESHOLD):
+        self._thresholds = thresholds or DEFAULT_THRESHOLDS
+        self._flow_threshold = flow_threshold
+
+        self.flow_started = None  # timestamp continuous flow started
+        self.flow_duration = 0.0
+        self.closed_psi = None  # highest pressure seen since the valve closed
+        self.pressure_drop = 0.0
+        self.leak = None  # reason a leak is currently detected (or None)
+
+    def thresholds(self, mode):
+        return self._thresholds.get(mode) or self._thresholds[MODE_HOME]
+
+    def add(self, timestamp, gpm, psi, valve_closed, mode):
+        """Process a telemetry sample, returning the leak reason (or None if no leak is detected)"""
+        thresholds = self.thresholds(mode)
+
+        if gpm is not None:
+            if gpm > self._flow_threshold:
+                if self.flow_started is None:
+                    self.flow_started = timestamp
+                self.flow_duration = timestamp - self.flow_started
+            else:
+                self.flow_started = None
+                self.flow_duration = 0.0
+
+        # pressure test: with the valve closed, any drop from the closed pressure means water is escaping
+        if valve_closed and psi is not None:
+            self.closed_psi = psi if self.closed_psi is None else max(self.closed_psi, psi)
+            self.pressure_drop = self.closed_psi - psi
+        elif not valve_closed:
+            self.closed_psi = None
+            self.pressure_drop = 0.0
+
+        if self.flow_duration >= thresholds[THRESHOLD_MAX_FLOW_DURATION]:
+            self.leak = LEAK_CONTINUOUS_FLOW
+        elif self.pressure_drop >= thresholds[THRESHOLD_PRESSURE_DROP]:
+            self.leak = LEAK_PRESSURE_DROP
+        else:
+            self.leak = None
+        return self.leak
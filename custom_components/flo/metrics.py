@@ -0,0 +1,168 @@
+"""
+Instrumentation of the Flo webservice calls and coordinator refreshes.
+
+Every call made by FloClient records its latency (in a fixed-bucket histogram, so
+memory stays constant), bytes received and errors by type, both per endpoint and
+per data class (the data class being refreshed when the call was made). Every
+coordinator refresh records its duration and outcome. Recording is O(1).
+"""
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+# upper bounds (seconds) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# calls made outside of a coordinator refresh (e.g. valve/mode commands)
+DATA_CLASS_OTHER = 'other'
+
+ERROR_CIRCUIT_OPEN = 'circuit_open'
+
+# data class being refreshed by the current task, used to attribute each call
+current_data_class = ContextVar('flo_data_class', default=DATA_CLASS_OTHER)
+
+
+class LatencyHistogram:
+    """Count of durations per latency bucket, with approximate percentiles"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket holding the q-th (0..1) percentile (capped at the max)"""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(LATENCY_BUCKETS[bucket], self.max) if bucket < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': _ms(self.mean),
+            'p50': _ms(self.percentile(0.5)),
+            'p95': _ms(self.percentile(0.95)),
+            'max': _ms(self.max if self.count else None),
+            'buckets': {
+                (f"<={_ms(bound)}ms" if bound else f">{_ms(LATENCY_BUCKETS[-1])}ms"): count
+                for bound, count in zip(LATENCY_BUCKETS + (None,), self.counts) if count
+            }
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+class CallStats:
+    """Latency, bytes received and errors of the calls to an endpoint (or for a data class)"""
+
+    __slots__ = ('latency', 'bytes', 'errors')
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.bytes = 0
+        self.errors = Counter()
+
+    @property
+    def calls(self):
+        return self.latency.count
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'bytes': self.bytes,
+            'errors': dict(self.errors),
+            'latency': self.latency.as_dict()
+        }
+
+
+class RefreshStats:
+    """Duration and outcome of the coordinator refreshes of a data class"""
+
+    __slots__ = ('duration', 'failures', 'last_duration')
+
+    def __init__(self):
+        self.duration = LatencyHistogram()
+        self.failures = 0
+        self.last_duration = None
+
+    def as_dict(self):
+        return {
+            'refreshes': self.duration.count,
+            'failures': self.failures,
+            'last_duration': _ms(self.last_duration),
+            'duration': self.duration.as_dict()
+        }
+
+
+def _stats(stats_by_key, key, stats_class):
+    stats = stats_by_key.get(key)
+    if stats is None:
+        stats = stats_by_key[key] = stats_class()
+    return stats
+
+
+class FloMetrics:
+    """Counters and latency histograms for all calls and refreshes of a Flo account"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.total = CallStats()
+        self.endpoints = {}  # 'METHOD /path/{id}' -> CallStats
+        self.data_classes = {}  # data class -> CallStats
+        self.refreshes = {}  # data class -> RefreshStats
+
+    def record_call(self, endpoint, seconds, size=0, error=None):
+        """Record a call (attributed to the data class currently being refreshed)"""
+        data_class = current_data_class.get()
+        for stats in (self.total, _stats(self.endpoints, endpoint, CallStats),
+                      _stats(self.data_classes, data_class, CallStats)):
+            if seconds is not None:
+                stats.latency.add(seconds)
+            stats.bytes += size
+            if error:
+                stats.errors[error] += 1
+
+    def record_refresh(self, data_class, seconds, failed=False):
+        stats = _stats(self.refreshes, data_class, RefreshStats)
+        stats.duration.add(seconds)
+        stats.last_duration = seconds
+        if failed:
+            stats.failures += 1
+
+    @property
+    def calls_per_hour(self):
+        hours = (time.monotonic() - self.started) / 3600
+        return round(self.total.calls / hours, 1) if hours else None
+
+    def as_dict(self):
+        return {
+            'uptime': round(time.monotonic() - self.started),
+            'calls_per_hour': self.calls_per_hour,
+            'total': self.total.as_dict(),
+            'endpoints': {endpoint: stats.as_dict() for endpoint, stats in self.endpoints.items()},
+            'data_classes': {data_class: stats.as_dict() for data_class, stats in self.data_classes.items()},
+            'refreshes': {data_class: stats.as_dict() for data_class, stats in self.refreshes.items()}
+        }
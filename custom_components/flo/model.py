@@ -0,0 +1,78 @@
+"""
+Compact snapshots of the Flo device and location data used by the entities.
+
+Flo responses are projected into these slotted objects as they are received, so the
+cache holds only the handful of fields the entities read rather than the complete
+JSON payloads (which are only fetched on demand for diagnostics).
+"""
+
+
+class Snapshot:
+    """Flat, slotted record of the fields used from a Flo payload"""
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+    def as_dict(self):
+        """Return the fields as a dict (for persistence and change tracking)"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class DeviceSnapshot(Snapshot):
+    """Current telemetry and valve state of a Flo device"""
+
+    __slots__ = ('id', 'gpm', 'psi', 'temp_f', 'valve_target', 'valve_last_known')
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Project a Flo device payload"""
+        current = (payload.get('telemetry') or {}).get('current') or {}
+        valve = payload.get('valve') or {}
+        return cls(
+            id=payload['id'],
+            gpm=current.get('gpm'),
+            psi=current.get('psi'),
+            temp_f=current.get('tempF'),
+            valve_target=valve.get('target'),
+            valve_last_known=valve.get('lastKnown')
+        )
+
+
+class LocationSnapshot(Snapshot):
+    """Monitoring mode and devices of a Flo location"""
+
+    __slots__ = ('id', 'nickname', 'system_mode', 'device_ids')
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Project a Flo location payload"""
+        return cls(
+            id=payload['id'],
+            nickname=payload.get('nickname'),
+            system_mode=(payload.get('systemMode') or {}).get('target'),
+            device_ids=tuple(device['id'] for device in payload.get('devices', []))
+        )
+
+    def as_dict(self):
+        data = super().as_dict()
+        data['device_ids'] = list(self.device_ids or ())
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{**data, 'device_ids': tuple(data.get('device_ids') or ())})
@@ -0,0 +1,141 @@
+"""
+On-demand profiling of the Flo update cycle (see the flo.profile service).
+
+The next N telemetry refresh cycles, and the entity updates and state writes they
+fan out to, are run under cProfile. Nothing is hooked while no profile is running.
+
+Time is reported per phase: wall-clock time of the refreshes and of waiting on Flo
+(from the call metrics), and CPU time spent in aiohttp, JSON decoding, building
+snapshots, change tracking, entity updates and state writes (from the profile).
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from datetime import datetime
+
+from .coordinator import DATA_CLASS_TELEMETRY
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_CYCLES = 5
+PROFILE_TIMEOUT = 3600  # seconds to wait for the cycles to complete
+
+# entity updates and state writes of the last cycle are dispatched after the refresh completes
+FANOUT_DELAY = 1.0  # seconds
+
+REPORT_TOP_FUNCTIONS = 40
+REPORT_FILENAME = 'flo_profile_{}'
+
+# CPU phase -> (fragment of the source file path, function name); without a function
+# name, the time spent in all the functions of the matching files is summed
+CPU_PHASES = {
+    'aiohttp': (f"{os.sep}aiohttp{os.sep}", None),
+    'json decoding': (f"json{os.sep}__init__.py", 'loads'),
+    'snapshots': (f"flo{os.sep}model.py", 'from_payload'),
+    'change tracking': (f"flo{os.sep}diff.py", 'update'),
+    'entity updates': (f"flo{os.sep}", 'update_from_cache'),
+    'state writes': (f"helpers{os.sep}entity.py", 'async_write_ha_state')
+}
+
+
+class ProfileInProgressError(Exception):
+    """Only one profile can run at a time"""
+
+
+def _wall_times(schedulers):
+    """Total seconds spent refreshing and waiting on Flo calls so far, across all accounts"""
+    refresh = sum(stats.duration.total for scheduler in schedulers for stats in scheduler.metrics.refreshes.values())
+    network = sum(scheduler.metrics.total.latency.total for scheduler in schedulers)
+    return refresh, network
+
+
+def cpu_phases(stats):
+    """Return the CPU seconds per phase from profile stats"""
+    phases = dict.fromkeys(CPU_PHASES, 0.0)
+    for (filename, _, function), (_, _, self_time, cumulative_time, _) in stats.stats.items():
+        for phase, (path, name) in CPU_PHASES.items():
+            if path not in filename:
+                continue
+            if name is None:
+                phases[phase] += self_time
+            elif function == name:
+                phases[phase] += cumulative_time
+    return phases
+
+
+class CycleProfiler:
+    """Profiles the next telemetry refresh cycles of all Flo accounts"""
+
+    _running = False
+
+    def __init__(self, hass, schedulers, cycles=DEFAULT_PROFILE_CYCLES):
+        self._hass = hass
+        self._schedulers = schedulers
+        self._cycles = cycles
+
+    async def async_run(self):
+        """Profile the cycles and write the report, returning (report path, summary)"""
+        if CycleProfiler._running:
+            raise ProfileInProgressError('A Flo profile is already running')
+        CycleProfiler._running = True
+
+        remaining = self._cycles
+        done = self._hass.loop.create_future()
+
+        def cycle_completed():
+            nonlocal remaining
+            remaining -= 1
+            if remaining <= 0 and not done.done():
+                done.set_result(None)
+
+        unsubscribe = [scheduler.coordinator(DATA_CLASS_TELEMETRY).async_add_listener(cycle_completed)
+                       for scheduler in self._schedulers]
+
+        profile = cProfile.Profile()
+        started_wall = _wall_times(self._schedulers)
+        started = time.monotonic()
+        profile.enable()
+        try:
+            await asyncio.wait_for(done, PROFILE_TIMEOUT)
+            await asyncio.sleep(FANOUT_DELAY)
+        finally:
+            profile.disable()
+            for remove_listener in unsubscribe:
+                remove_listener()
+            CycleProfiler._running = False
+
+        elapsed = time.monotonic() - started
+        refresh, network = (now - before for now, before in zip(_wall_times(self._schedulers), started_wall))
+        phases = {'refresh (wall)': refresh, 'waiting on Flo (wall)': network,
+                  **{f"{phase} (cpu)": seconds for phase, seconds in cpu_phases(pstats.Stats(profile)).items()}}
+
+        summary = (f"Profiled {self._cycles} Flo refresh cycles over {elapsed:.1f}s: "
+                   + ', '.join(f"{phase} {seconds:.3f}s" for phase, seconds in phases.items()))
+        path = await self._hass.async_add_executor_job(self._write_report, profile, phases, summary)
+        LOG.info(f"{summary} (report {path})")
+        return path, summary
+
+    def _write_report(self, profile, phases, summary):
+        base = self._hass.config.path(REPORT_FILENAME.format(datetime.now().strftime('%Y%m%d_%H%M%S')))
+
+        # the raw profile can be explored with pstats or snakeviz
+        profile.dump_stats(f"{base}.prof")
+
+        report = io.StringIO()
+        report.write(f"{summary}\n\nTime per phase (s):\n")
+        for phase, seconds in phases.items():
+            report.write(f"  {phase:<28} {seconds:10.4f}\n")
+
+        stats = pstats.Stats(profile, stream=report).strip_dirs()
+        report.write(f"\nTop {REPORT_TOP_FUNCTIONS} functions by cumulative time:\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_TOP_FUNCTIONS)
+        report.write(f"\nTop {REPORT_TOP_FUNCTIONS} functions by own time:\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(REPORT_TOP_FUNCTIONS)
+
+        with open(f"{base}.txt", 'w') as report_file:
+            report_file.write(report.getvalue())
+        return f"{base}.txt"
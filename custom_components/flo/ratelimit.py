@@ -0,0 +1,138 @@
+"""
+Client-side request budget for the Flo cloud service.
+
+A token bucket shared by every request made for a Flo account, refilled at a
+requests-per-minute rate. When the budget is exhausted, requests queue up and are
+released in priority order (commands before telemetry, then consumption, and
+history backfill last).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+# priority lanes (lower is served first)
+PRIORITY_COMMAND = 0
+PRIORITY_TELEMETRY = 1
+PRIORITY_CONSUMPTION = 2
+PRIORITY_BACKFILL = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_COMMAND: 'command',
+    PRIORITY_TELEMETRY: 'telemetry',
+    PRIORITY_CONSUMPTION: 'consumption',
+    PRIORITY_BACKFILL: 'backfill'
+}
+
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_BURST = 10  # requests that can be made back to back after an idle period
+
+
+class RateLimiter:
+    """Token bucket with priority lanes for waiting requests"""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST):
+        self.requests_per_minute = requests_per_minute
+        self._rate = requests_per_minute / 60.0  # tokens per second
+        self._capacity = max(1, min(burst, requests_per_minute))
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._timer = None
+
+        self.request_count = 0
+        self.exhausted_count = 0  # requests that found the budget exhausted and had to wait
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_exhausted = None  # wall clock time the budget was last exhausted
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    @property
+    def available(self):
+        """Requests that can currently be made without waiting"""
+        self._refill()
+        return int(self._tokens)
+
+    def queued(self, priority=None):
+        """Number of requests waiting for budget (optionally only for one priority lane)"""
+        return sum(1 for waiter in self._waiters
+                   if not waiter[2].done() and (priority is None or waiter[0] == priority))
+
+    async def async_acquire(self, priority=PRIORITY_TELEMETRY):
+        """Wait until the budget allows a request at this priority"""
+        self.request_count += 1
+        self._refill()
+
+        # never jump ahead of requests already waiting at the same or a higher priority
+        if self._tokens >= 1 and not any(waiter[0] <= priority for waiter in self._waiters):
+            self._tokens -= 1
+            return
+
+        self.exhausted_count += 1
+        self.last_exhausted = time.time()
+        LOG.debug(f"Flo request budget exhausted, queueing {PRIORITY_NAMES.get(priority)} request")
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._schedule_release()
+
+        started = time.monotonic()
+        await future
+
+        waited = time.monotonic() - started
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _schedule_release(self):
+        if self._timer is None and self._waiters:
+            delay = max(0.0, (1 - self._tokens) / self._rate)
+            self._timer = asyncio.get_event_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # waiter was cancelled
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+
+        # drop cancelled waiters so they do not keep the timer running
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+        self._schedule_release()
+
+    @property
+    def stats(self):
+        """Diagnostic counters for the request budget"""
+        return {
+            'requests_per_minute': self.requests_per_minute,
+            'available': self.available,
+            'requests': self.request_count,
+            'exhausted': self.exhausted_count,
+            'last_exhausted': self.last_exhausted,
+            'max_wait': round(self.max_wait, 2),
+            'total_wait': round(self.total_wait, 2),
+            'queued': {name: self.queued(priority) for priority, name in PRIORITY_NAMES.items()}
+        }
+
+    def cancel(self):
+        """Stop the release timer (waiting requests are cancelled)"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters = []
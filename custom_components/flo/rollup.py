@@ -0,0 +1,149 @@
+"""
+Persisted per-device store of closed daily water consumption totals.
+
+Year-to-date consumption is the (cached) sum of the closed days of the current year
+plus today's running total, so closed days only need to be fetched from Flo once.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from pyflowater.const import INTERVAL_DAILY
+
+from .const import FLO_DOMAIN
+
+LOG = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{FLO_DOMAIN}.daily_consumption"
+SAVE_DELAY = 30  # seconds
+
+BACKFILL_BATCH_DAYS = 31  # max days requested from Flo per backfill call
+
+# Flo may still adjust the most recent closed days, so re-fetch those once per day
+RECONCILE_INTERVAL = timedelta(days=1)
+RECONCILE_DAYS = 3
+
+ATTR_DAYS = 'days'
+ATTR_RECONCILED = 'reconciled'
+
+
+def _date_ranges(days, batch_size):
+    """Group sorted dates into contiguous (start, end) ranges of at most batch_size days"""
+    ranges = []
+    for day in days:
+        if ranges:
+            start, end = ranges[-1]
+            if day == end + timedelta(days=1) and (day - start).days < batch_size:
+                ranges[-1] = (start, day)
+                continue
+        ranges.append((day, day))
+    return ranges
+
+
+def _local_date(value):
+    """Return the local date (YYYY-MM-DD) of a Flo consumption item time (naive times are local)"""
+    time = dt_util.parse_datetime(value)
+    if time is None:
+        return value[:10]
+    if time.tzinfo:
+        time = dt_util.as_local(time)
+    return time.date().isoformat()
+
+
+class DailyConsumptionStore:
+    """Closed daily consumption totals for all Flo devices, persisted in HA storage"""
+
+    def __init__(self, hass, flo, storage_id=None):
+        self._flo = flo
+        key = f"{STORAGE_KEY}.{storage_id}" if storage_id else STORAGE_KEY
+        self._store = Store(hass, STORAGE_VERSION, key)
+
+        # device_id -> { 'days': { 'YYYY-MM-DD': gallons }, 'reconciled': 'YYYY-MM-DD' }
+        self._data = {}
+
+        # device_id -> (date computed, sum of closed days in that year)
+        self._closed_totals = {}
+        self._locks = {}
+
+    async def async_load(self):
+        self._data = await self._store.async_load() or {}
+
+    def _async_save(self):
+        self._store.async_delay_save(lambda: self._data, SAVE_DELAY)
+
+    def _device(self, device_id):
+        return self._data.setdefault(device_id, {ATTR_DAYS: {}, ATTR_RECONCILED: None})
+
+    async def _async_fetch_days(self, device_id, start, end):
+        """Fetch daily totals for the (inclusive) date range from Flo into the store"""
+        start_date = datetime.combine(start, datetime.min.time())
+        end_date = datetime.combine(end, datetime.max.time())
+
+        data = await self._flo.async_consumption(
+            device_id, start_date=start_date, end_date=end_date, interval=INTERVAL_DAILY)
+        if not data:
+            return
+
+        days = self._device(device_id)[ATTR_DAYS]
+
+        # days Flo has no data for (e.g. before the device was installed) are closed at zero
+        day = start
+        while day <= end:
+            days.setdefault(day.isoformat(), 0)
+            day += timedelta(days=1)
+
+        for item in data.get('items', []):
+            day = _local_date(item['time'])
+            days[day] = round(item.get('gallonsConsumed') or 0, 2)
+
+        self._closed_totals.pop(device_id, None)
+        self._async_save()
+
+    async def _async_sync(self, device_id, today):
+        """Backfill any missing closed days of this year and reconcile the most recent ones"""
+        device = self._device(device_id)
+        days = device[ATTR_DAYS]
+
+        # drop days from previous years, they are never used again
+        year_prefix = f"{today.year:04d}-"
+        for day in [day for day in days if not day.startswith(year_prefix)]:
+            del days[day]
+
+        first_day = today.replace(month=1, day=1)
+        closed_days = [first_day + timedelta(days=n) for n in range((today - first_day).days)]
+
+        missing = [day for day in closed_days if day.isoformat() not in days]
+        if missing:
+            LOG.debug(f"Backfilling {len(missing)} days of Flo consumption for {device_id}")
+
+        # re-check the most recent closed days on a slow cadence
+        reconciled = device[ATTR_RECONCILED]
+        if reconciled is None or today - datetime.strptime(reconciled, '%Y-%m-%d').date() >= RECONCILE_INTERVAL:
+            missing = sorted(set(missing) | set(closed_days[-RECONCILE_DAYS:]))
+
+        for start, end in _date_ranges(missing, BACKFILL_BATCH_DAYS):
+            await self._async_fetch_days(device_id, start, end)
+
+        if device[ATTR_RECONCILED] != today.isoformat():
+            device[ATTR_RECONCILED] = today.isoformat()
+            self._async_save()
+
+    async def async_closed_total(self, device_id):
+        """Return the current date and the total gallons of all closed days of its year"""
+        today = datetime.now().date()
+
+        lock = self._locks.setdefault(device_id, asyncio.Lock())
+        async with lock:
+            await self._async_sync(device_id, today)
+
+            cached = self._closed_totals.get(device_id)
+            if cached is None or cached[0] != today:
+                days = self._device(device_id)[ATTR_DAYS]
+                total = sum(gallons for day, gallons in days.items() if day < today.isoformat())
+                cached = self._closed_totals[device_id] = (today, total)
+
+        return cached
@@ -2,103 +2,111 @@
 Support for Flo water inflow monitoring and control devices
 
 FUTURE:
-- convert to async
 - should we have a "sensor" that shows whether the Flo device is "online" (e.g. connected to the Flo cloud + WiFi rssi/ssid)
 - should this use Flo's every 15-minutes average rollup instead of current telemetry?
-- could change to non-polling mode (since the "switch" does the actual polling, these would just update whenever the switch detects a state change)
 """
-from datetime import datetime, timedelta
-import time
 import logging
-import voluptuous as vol
 
-from homeassistant.const import TEMP_FAHRENHEIT, ATTR_TEMPERATURE, CONF_SCAN_INTERVAL, ATTR_ENTITY_ID, DEVICE_CLASS_PRESSURE, DEVICE_CLASS_TEMPERATURE
-from homeassistant.helpers.entity import Entity
-from homeassistant.components.sensor import PLATFORM_SCHEMA
+from homeassistant.const import TEMP_FAHRENHEIT, DEVICE_CLASS_PRESSURE, DEVICE_CLASS_TEMPERATURE
 from homeassistant.util import dt as dt_util
-import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.dispatcher import async_dispatcher_connect, async_dispatcher_send
 
 from pyflowater.const import FLO_MODES
-from .const import ICON_FLOW_RATE, ICON_TEMP, ICON_CONSUMPTION, ICON_PRESSURE, ICON_MONITORING
-
-from . import FloEntity, FloDeviceEntity, FloLocationEntity, FLO_DOMAIN, FLO_SERVICE, CONF_LOCATION_ID
+from .const import ICON_FLOW_RATE, ICON_TEMP, ICON_CONSUMPTION, ICON_PRESSURE, ICON_MONITORING, ICON_API_BUDGET, ICON_API_LATENCY, ICON_API_CALLS, ATTR_LOCATIONS, ATTR_MODE_SENSORS
+
+from .telemetry import MAX_VALID_TEMP_F
+from .coordinator import (
+    DATA_CLASS_TELEMETRY,
+    DATA_CLASS_MODE,
+    DATA_CLASS_CONSUMPTION,
+    DATA_CLASS_YEARLY,
+    FIELD_CONSUMPTION,
+    FIELD_CLOSED_TOTAL,
+    ATTR_DATE,
+    ATTR_GALLONS
+)
+from . import (
+    FloEntity,
+    FloDeviceEntity,
+    FloLocationEntity,
+    FLO_DOMAIN,
+    FLO_SERVICE,
+    DEADBAND_FLOW,
+    DEADBAND_PRESSURE,
+    DEADBAND_TEMPERATURE,
+    async_get_location
+)
 
 LOG = logging.getLogger(__name__)
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_LOCATION_ID): cv.string
-})
-
 UNIT_GALLONS = 'g'
 UNIT_GALLONS_PER_MINUTE = 'gpm'
 UNIT_PSI = 'psi'
 
-ATTR_MODE = 'mode'
-
-SERVICE_SET_MODE = 'set_mode'
-SERVICE_SET_MODE_SCHEMA = {
-    vol.Required(ATTR_ENTITY_ID): cv.time_period,
-    vol.Required(ATTR_MODE): vol.In(FLO_MODES)
-}
-SERVICE_SET_MODE_SIGNAL = f"{SERVICE_SET_MODE}_%s"
+ATTR_POLL_INTERVAL = 'poll_interval'
+ATTR_FLOWING_SECONDS = 'flowing_seconds'
 
-# pylint: disable=unused-argument
-def setup_platform(hass, config, add_sensors_callback, discovery_info=None):
-    """Setup the Flo water monitoring sensors"""
 
-    flo = hass.data[FLO_SERVICE]
-    if flo is None or not flo.is_connected:
-        LOG.warning("No connection to Flo service, ignoring setup of platform sensor")
-        return False
+UNIT_REQUESTS = 'requests'
 
-    if discovery_info:
-        location_id = discovery_info[CONF_LOCATION_ID]
-    else:  # manual config
-        location_id = config[CONF_LOCATION_ID]
+ATTR_REQUESTS_PER_MINUTE = 'requests_per_minute'
+ATTR_BUDGET_EXHAUSTED = 'budget_exhausted'
+ATTR_LAST_EXHAUSTED = 'last_exhausted'
+ATTR_MAX_WAIT = 'max_wait'
+ATTR_QUEUED = 'queued'
 
-    location = flo.location(location_id)
-    if not location:
-        LOG.warning(f"Flo location {location_id} not found, ignoring creation of Flo sensors")
-        return False
+UNIT_MILLISECONDS = 'ms'
+UNIT_CALLS_PER_HOUR = 'calls/h'
 
-    sensors = []
-    mode_sensors = {}
+ATTR_P50 = 'p50'
+ATTR_MAX = 'max'
+ATTR_ERRORS = 'errors'
 
-    # create device-based sensors for all devices at this location
-    for device_details in location['devices']:
-        device_id = device_details['id']
+async def async_setup_entry(hass, entry, add_sensors_callback):
+    """Setup the Flo water monitoring sensors for all locations of a Flo account"""
+    flo_data = hass.data[FLO_DOMAIN][entry.entry_id]
 
-        sensors.append( FloRateSensor(hass, device_id))
-        sensors.append( FloPressureSensor(hass, device_id))
-        sensors.append( FloTempSensor(hass, device_id))
-        #sensors.append( FloPhysicalValveSensor(hass, device_id))
-        sensors.append( FloDailyConsumptionSensor(hass, device_id))
-        sensors.append( FloYearlyConsumptionSensor(hass, device_id))
+    sensors = []
 
-    # create location-based sensors
-    # add sensor that tracks the current monitoring mode for a location
-    mode_sensor = FloMonitoringMode(hass, location_id)
-    sensors.append( mode_sensor )
-    mode_sensors[mode_sensor.entity_id] = mode_sensor
+    for location_id in flo_data[ATTR_LOCATIONS]:
+        location = await async_get_location(flo_data, location_id)
+        if not location:
+            LOG.warning(f"Flo location {location_id} not found, ignoring creation of Flo sensors")
+            continue
+
+        # create device-based sensors for all devices at this location
+        for device_id in location.device_ids:
+            sensors.append( FloRateSensor(flo_data, device_id))
+            sensors.append( FloPressureSensor(flo_data, device_id))
+            sensors.append( FloTempSensor(flo_data, device_id))
+            #sensors.append( FloPhysicalValveSensor(flo_data, device_id))
+            sensors.append( FloDailyConsumptionSensor(flo_data, device_id))
+            sensors.append( FloYearlyConsumptionSensor(flo_data, device_id))
+
+        # create location-based sensors
+        # add sensor that tracks the current monitoring mode for a location
+        sensors.append( FloMonitoringMode(flo_data, location_id) )
+
+    # diagnostic sensor for the account's request budget (if rate limiting is enabled)
+    if flo_data[FLO_SERVICE].rate_limiter:
+        sensors.append( FloApiBudgetSensor(flo_data, entry.entry_id) )
+
+    # diagnostic sensors for the latency and volume of the account's Flo calls
+    sensors.append( FloApiLatencySensor(flo_data, entry.entry_id) )
+    sensors.append( FloApiCallsSensor(flo_data, entry.entry_id) )
 
     add_sensors_callback(sensors)
 
-    # register any exposed services
-    def service_set_mode(call):
-        entity = mode_sensors[ call.data[ATTR_ENTITY_ID] ]
-        mode = call.data[ATTR_MODE]
-        if entity:
-            entity.set_mode(mode)
-
-    hass.services.register(FLO_DOMAIN, SERVICE_SET_MODE, service_set_mode, SERVICE_SET_MODE)
-
 class FloRateSensor(FloDeviceEntity):
     """Water flow rate sensor for a Flo device"""
 
-    def __init__(self, hass, device_id):
-        super().__init__(hass, 'Water Flow Rate', device_id)
-        self.update()
+    DATA_CLASSES = (DATA_CLASS_TELEMETRY,)
+    SOURCE_FIELDS = (('gpm',),)
+    DEADBAND = DEADBAND_FLOW
+    WINDOW_FIELD = 'gpm'
+
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, 'Water Flow Rate', device_id)
+        self.update_from_cache()
 
     @property
     def unit_of_measurement(self):
@@ -109,12 +117,27 @@ class FloRateSensor(FloDeviceEntity):
     def icon(self):
         return ICON_FLOW_RATE
 
-    def update(self):
+    def update_from_cache(self):
         """Update sensor state"""
         state = self.get_telemetry('gpm')
         if state != None:
             self.update_state( round(state, 1) )
 
+        self.update_cycle_attributes()
+
+    def update_cycle_attributes(self):
+        history = self.update_window_stats('gpm')
+        if history:
+            self._attrs[ATTR_FLOWING_SECONDS] = round(history.flowing_seconds)
+
+        # expose the effective (possibly adaptive) telemetry polling interval, written as soon as it changes
+        if not self.scheduler:
+            return False
+        poll_interval = self.scheduler.telemetry_interval.total_seconds()
+        changed = self._attrs.get(ATTR_POLL_INTERVAL) != poll_interval
+        self._attrs[ATTR_POLL_INTERVAL] = poll_interval
+        return changed
+
     @property
     def unique_id(self):
         return f"flo_rate_{self._device_id}"
@@ -123,9 +146,14 @@ class FloRateSensor(FloDeviceEntity):
 class FloTempSensor(FloDeviceEntity):
     """Water temp sensor for a Flo device"""
 
-    def __init__(self, hass, device_id):
-        super().__init__(hass, 'Water Temperature', device_id)
-        self.update()
+    DATA_CLASSES = (DATA_CLASS_TELEMETRY,)
+    SOURCE_FIELDS = (('temp_f',),)
+    DEADBAND = DEADBAND_TEMPERATURE
+    WINDOW_FIELD = 'temp_f'
+
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, 'Water Temperature', device_id)
+        self.update_from_cache()
 
     @property
     def unit_of_measurement(self):
@@ -135,16 +163,17 @@ class FloTempSensor(FloDeviceEntity):
     def icon(self):
         return ICON_TEMP
 
-    def update(self):
+    def update_from_cache(self):
         """Update sensor state"""
-        state = self.get_telemetry('tempF')
+        state = self.get_telemetry('temp_f')
         if state:
             # Flo has (temporarily?) deprecated their temperature API and returns VERY high temps,
             # so DO NOT update the state IF the temperatures are high.
-            if int(state) > 140:
+            if int(state) > MAX_VALID_TEMP_F:
                 return
 
             self.update_state(state)
+            self.update_window_stats('temp_f')
 
     @property
     def unique_id(self):
@@ -159,9 +188,14 @@ class FloTempSensor(FloDeviceEntity):
 class FloPressureSensor(FloDeviceEntity):
     """Water pressure sensor for a Flo device"""
 
-    def __init__(self, hass, device_id):
-        super().__init__(hass, 'Water Pressure', device_id)
-        self.update()
+    DATA_CLASSES = (DATA_CLASS_TELEMETRY,)
+    SOURCE_FIELDS = (('psi',),)
+    DEADBAND = DEADBAND_PRESSURE
+    WINDOW_FIELD = 'psi'
+
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, 'Water Pressure', device_id)
+        self.update_from_cache()
 
     @property
     def unit_of_measurement(self):
@@ -171,11 +205,12 @@ class FloPressureSensor(FloDeviceEntity):
     def icon(self):
         return ICON_PRESSURE
 
-    def update(self):
+    def update_from_cache(self):
         """Update sensor state"""
         state = self.get_telemetry('psi')
         if state:
             self.update_state( round(state, 1) )
+            self.update_window_stats('psi')
 
     @property
     def unique_id(self):
@@ -187,15 +222,12 @@ class FloPressureSensor(FloDeviceEntity):
         return DEVICE_CLASS_PRESSURE
 
 class FloDailyConsumptionSensor(FloDeviceEntity):
-    def __init__(self, hass, device_id):
-        super().__init__(hass, f"Daily Water Consumption", device_id)
-        self._unique_id = f"flo_daily_consumption_{device_id}"
+    DATA_CLASSES = (DATA_CLASS_CONSUMPTION,)
+    SOURCE_FIELDS = (FIELD_CONSUMPTION,)
 
-    @property
-    def should_poll(self):
-        # FIXME: need to set appropriate scan_intervals:
-        #  - daily (every 10 minutes)
-        return True
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, f"Daily Water Consumption", device_id)
+        self._unique_id = f"flo_daily_consumption_{device_id}"
 
     @property
     def unit_of_measurement(self):
@@ -205,26 +237,22 @@ class FloDailyConsumptionSensor(FloDeviceEntity):
     def icon(self):
         return ICON_CONSUMPTION
 
-    def update(self):
-        # default consumption from pyflowater is daily rollup
-        data = self.flo_service.consumption(self._device_id)
-        if data:
-            self.update_state( round(data['aggregations']['sumTotalGallonsConsumed'], 1) )
+    def update_from_cache(self):
+        today_total = self.scheduler.consumption.get(self._device_id)
+        if today_total is not None:
+            self.update_state( round(today_total[ATTR_GALLONS], 1) )
 
     @property
     def unique_id(self):
         return self._unique_id
 
 class FloYearlyConsumptionSensor(FloDeviceEntity):
-    def __init__(self, hass, device_id):
-        super().__init__(hass, f"Yearly Water Consumption", device_id)
-        self._unique_id = f"flo_yearly_consumption_{device_id}"
+    DATA_CLASSES = (DATA_CLASS_CONSUMPTION, DATA_CLASS_YEARLY)
+    SOURCE_FIELDS = (FIELD_CONSUMPTION, FIELD_CLOSED_TOTAL)
 
-    @property
-    def should_poll(self):
-        # FIXME: need to set appropriate scan_intervals:
-        #  - yearly (every day? every hour?)
-        return True
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, f"Yearly Water Consumption", device_id)
+        self._unique_id = f"flo_yearly_consumption_{device_id}"
 
     @property
     def unit_of_measurement(self):
@@ -234,14 +262,18 @@ class FloYearlyConsumptionSensor(FloDeviceEntity):
     def icon(self):
         return ICON_CONSUMPTION
 
-    # FIXME: @Throttle
-    def update(self):
-        now = datetime.now()
-        start_time = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0).replace(tzinfo=None)
+    def update_from_cache(self):
+        """Year-to-date is the stored closed days of this year plus today's running total"""
+        closed_total = self.scheduler.closed_totals.get(self._device_id)
+        today_total = self.scheduler.consumption.get(self._device_id)
+        if closed_total is None or today_total is None:
+            return
 
-        data = self.flo_service.consumption(self._device_id, startDate=start_time)
-        if data:
-            self.update_state( round(data['aggregations']['sumTotalGallonsConsumed'], 1) )
+        # around midnight one of the totals may still be for the previous day
+        if closed_total[ATTR_DATE] != today_total[ATTR_DATE]:
+            LOG.debug(f"Waiting for the {today_total[ATTR_DATE]} Flo consumption totals of {self._device_id}")
+            return
+        self.update_state( round(closed_total[ATTR_GALLONS] + today_total[ATTR_GALLONS], 1) )
 
     @property
     def unique_id(self):
@@ -256,34 +288,147 @@ class FloYearlyConsumptionSensor(FloDeviceEntity):
 class FloMonitoringMode(FloLocationEntity):
     """Sensor returning current monitoring mode for the Flo location"""
 
-    def __init__(self, hass, location_id):
-        super().__init__(hass, 'Flo Monitoring Mode', location_id)
+    DATA_CLASSES = (DATA_CLASS_MODE,)
+    SOURCE_FIELDS = (('system_mode',),)
+
+    def __init__(self, flo_data, location_id):
+        super().__init__(flo_data, 'Flo Monitoring Mode', location_id)
 
     @property
     def icon(self):
         return ICON_MONITORING
 
-    def update(self):
+    def update_from_cache(self):
         """Update sensor state"""
-        mode = self.location_state.get('systemMode')
-        return self.update_state(mode.get('target'))
+        if not self.location_state:
+            return
 
-    def set_mode(self, mode):
+        mode = self.location_state.system_mode
+        if mode:
+            self.update_state(mode)
+
+    async def async_set_mode(self, mode):
         if not mode in FLO_MODES:
             LOG.info(f"Invalid Flo location monitoring mode '{mode}', IGNORING! (valid={FLO_MODES})")
             return
 
-        self.flo_service.set_mode(self._location_id, mode)
+        await self.flo_service.async_set_mode(self._location_id, mode)
         self.update_state(mode)
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self):
         """Run when entity is about to be added to hass."""
-        async_dispatcher_connect(
-            self.hass,
-            SERVICE_SET_MODE_SIGNAL.format(self.entity_id),
-            self.set_mode
-        )
+        await super().async_added_to_hass()
+
+        # modes of all locations can be set at once by the bulk services
+        self._flo_data[ATTR_MODE_SENSORS][self._location_id] = self
+        self.async_on_remove(lambda: self._flo_data[ATTR_MODE_SENSORS].pop(self._location_id, None))
 
     @property
     def unique_id(self):
         return f"flo_mode_{self._location_id}"
+
+
+class FloApiBudgetSensor(FloEntity):
+    """Diagnostic sensor showing the remaining Flo request budget for an account"""
+
+    def __init__(self, flo_data, entry_id):
+        super().__init__(flo_data, 'Flo API Budget')
+        self._unique_id = f"flo_api_budget_{entry_id}"
+
+    @property
+    def should_poll(self):
+        """The request budget is local state, so is polled rather than pushed by a coordinator"""
+        return True
+
+    @property
+    def unit_of_measurement(self):
+        return UNIT_REQUESTS
+
+    @property
+    def icon(self):
+        return ICON_API_BUDGET
+
+    def update_from_cache(self):
+        stats = self.flo_service.rate_limiter.stats
+        self.update_state(stats['available'])
+
+        self._attrs[ATTR_REQUESTS_PER_MINUTE] = stats['requests_per_minute']
+        self._attrs[ATTR_BUDGET_EXHAUSTED] = stats['exhausted']
+        self._attrs[ATTR_LAST_EXHAUSTED] = dt_util.utc_from_timestamp(stats['last_exhausted']).isoformat() \
+            if stats['last_exhausted'] else None
+        self._attrs[ATTR_MAX_WAIT] = stats['max_wait']
+        self._attrs[ATTR_QUEUED] = stats['queued']
+
+    async def async_update(self):
+        self.update_from_cache()
+
+    @property
+    def unique_id(self):
+        return self._unique_id
+
+
+class FloApiMetricsSensor(FloEntity):
+    """Base class for the diagnostic sensors on the calls made for a Flo account"""
+
+    def __init__(self, flo_data, name, unique_id):
+        super().__init__(flo_data, name)
+        self._unique_id = unique_id
+
+    @property
+    def should_poll(self):
+        """The metrics are local state, so are polled rather than pushed by a coordinator"""
+        return True
+
+    @property
+    def metrics(self):
+        return self.flo_service.metrics
+
+    async def async_update(self):
+        self.update_from_cache()
+
+    @property
+    def unique_id(self):
+        return self._unique_id
+
+
+class FloApiLatencySensor(FloApiMetricsSensor):
+    """Diagnostic sensor showing the 95th percentile latency of Flo calls (breakdowns are in the diagnostics)"""
+
+    def __init__(self, flo_data, entry_id):
+        super().__init__(flo_data, 'Flo API Latency', f"flo_api_latency_{entry_id}")
+
+    @property
+    def unit_of_measurement(self):
+        return UNIT_MILLISECONDS
+
+    @property
+    def icon(self):
+        return ICON_API_LATENCY
+
+    def update_from_cache(self):
+        total = self.metrics.total.latency.as_dict()
+        self.update_state(total['p95'])
+        self._attrs[ATTR_P50] = total['p50']
+        self._attrs[ATTR_MAX] = total['max']
+
+
+class FloApiCallsSensor(FloApiMetricsSensor):
+    """Diagnostic sensor showing the rate of Flo calls (breakdowns are in the diagnostics)"""
+
+    def __init__(self, flo_data, entry_id):
+        super().__init__(flo_data, 'Flo API Calls', f"flo_api_calls_{entry_id}")
+
+    @property
+    def unit_of_measurement(self):
+        return UNIT_CALLS_PER_HOUR
+
+    @property
+    def icon(self):
+        return ICON_API_CALLS
+
+    def update_from_cache(self):
+        self.update_state(self.metrics.calls_per_hour)
+
+        # large, ever-changing attributes would bloat the recorder, so only the total error count
+        self._attrs[ATTR_ERRORS] = sum(self.metrics.total.errors.values())
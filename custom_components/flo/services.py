@@ -0,0 +1,213 @@
+"""
+Integration-wide Flo services, registered once for all Flo accounts.
+
+Services target entities by entity_id (looked up in the integration-wide entity
+index) or act on every valve or location of every configured Flo account. Commands
+are issued concurrently (at most BULK_MAX_CONCURRENCY requests at once, while valve
+moves are confirmed without holding a slot) and the per-target results are reported
+in a flo_bulk_command_result event. The profile service
+profiles the next refresh cycles of every account (see profiler.py).
+"""
+import asyncio
+import logging
+import voluptuous as vol
+
+from homeassistant.const import ATTR_ENTITY_ID
+import homeassistant.helpers.config_validation as cv
+
+from pyflowater.const import FLO_MODES
+from .const import (
+    FLO_DOMAIN,
+    ATTR_VALVES,
+    ATTR_MODE_SENSORS,
+    ATTR_ENTITIES,
+    ATTR_SCHEDULER,
+    VALVE_OPEN,
+    VALVE_CLOSED
+)
+from .profiler import CycleProfiler, ProfileInProgressError, DEFAULT_PROFILE_CYCLES
+
+LOG = logging.getLogger(__name__)
+
+BULK_MAX_CONCURRENCY = 8
+
+SERVICE_CLOSE_ALL_VALVES = 'close_all_valves'
+SERVICE_OPEN_VALVES = 'open_valves'
+SERVICE_SET_MODE_ALL = 'set_mode_all'
+SERVICE_SET_MODE = 'set_mode'
+SERVICE_RUN_HEALTH_TEST = 'run_health_test'
+SERVICE_PROFILE = 'profile'
+
+ATTR_MODE = 'mode'
+ATTR_SERVICE = 'service'
+ATTR_RESULTS = 'results'
+ATTR_TARGET = 'target'
+ATTR_RESULT = 'result'
+ATTR_ERROR = 'error'
+ATTR_CYCLES = 'cycles'
+
+RESULT_CONFIRMED = 'confirmed'
+RESULT_UNCONFIRMED = 'unconfirmed'  # command accepted, but the device did not report the move in time
+RESULT_SUPERSEDED = 'superseded'  # a newer command was issued for the valve before this one was confirmed
+RESULT_OK = 'ok'
+RESULT_FAILED = 'failed'
+
+EVENT_BULK_COMMAND_RESULT = 'flo_bulk_command_result'
+
+PROFILE_NOTIFICATION_ID = 'flo_profile'
+
+SERVICE_SET_MODE_ALL_SCHEMA = vol.Schema({
+    vol.Required(ATTR_MODE): vol.In(FLO_MODES)
+})
+SERVICE_SET_MODE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    vol.Required(ATTR_MODE): vol.In(FLO_MODES)
+})
+SERVICE_RUN_HEALTH_TEST_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids
+})
+SERVICE_OPEN_VALVES_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_ENTITY_ID): cv.entity_ids
+})
+SERVICE_PROFILE_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_CYCLES, default=DEFAULT_PROFILE_CYCLES): vol.All(vol.Coerce(int), vol.Range(min=1, max=100))
+})
+
+
+def _account_data(hass):
+    """Return the shared data of every loaded Flo account (config entry)"""
+    accounts = []
+    for entry in hass.config_entries.async_entries(FLO_DOMAIN):
+        flo_data = hass.data.get(FLO_DOMAIN, {}).get(entry.entry_id)
+        if flo_data:
+            accounts.append(flo_data)
+    return accounts
+
+
+def _all_entities(hass, key):
+    return [entity for flo_data in _account_data(hass) for entity in flo_data[key].values()]
+
+
+def _entities(hass, service, entity_ids, method):
+    """Return the Flo entities with the given ids supporting the service method"""
+    index = hass.data[FLO_DOMAIN][ATTR_ENTITIES]
+    entities = []
+    for entity_id in entity_ids:
+        entity = index.get(entity_id)
+        if entity is None or not hasattr(entity, method):
+            LOG.warning(f"Flo {service} is not supported by {entity_id}, ignoring")
+            continue
+        entities.append(entity)
+    return entities
+
+
+async def async_run_bulk(hass, service, targets, command, max_concurrency=BULK_MAX_CONCURRENCY):
+    """Run command(target, slot) concurrently for all targets, reporting the result of each target.
+
+    command returns a result (or raises), targets are entities. Commands hold the slot
+    (a semaphore bounding concurrent requests) only while sending their requests, so
+    slow confirmations don't delay the commands of other targets.
+    """
+    slot = asyncio.Semaphore(max_concurrency)
+
+    async def run(entity):
+        result = {ATTR_TARGET: entity.entity_id}
+        try:
+            result[ATTR_RESULT] = await command(entity, slot)
+        except Exception as ex:  # pylint: disable=broad-except
+            LOG.warning(f"Flo {service} failed for {entity.entity_id}: {ex}")
+            result[ATTR_RESULT] = RESULT_FAILED
+            result[ATTR_ERROR] = str(ex)
+        return result
+
+    results = await asyncio.gather(*[run(entity) for entity in targets])
+    LOG.info(f"Flo {service} completed for {len(results)} targets: "
+             f"{sum(1 for result in results if result[ATTR_RESULT] != RESULT_FAILED)} succeeded")
+
+    hass.bus.async_fire(EVENT_BULK_COMMAND_RESULT, {ATTR_SERVICE: service, ATTR_RESULTS: results})
+    return results
+
+
+def _valve_result(confirmed):
+    if confirmed is None:
+        return RESULT_SUPERSEDED
+    return RESULT_CONFIRMED if confirmed else RESULT_UNCONFIRMED
+
+
+async def _async_move_valve(valve, target, slot):
+    """Send the valve command within the slot, then confirm it without holding the slot"""
+    async with slot:
+        started = await valve.async_send_valve_command(target)
+    return _valve_result(await valve.async_confirm_valve_command(target, started))
+
+
+def async_register_services(hass):
+    """Register the integration-wide Flo services"""
+
+    async def async_close_all_valves(call):
+        async def close(valve, slot):
+            return await _async_move_valve(valve, VALVE_CLOSED, slot)
+        await async_run_bulk(hass, SERVICE_CLOSE_ALL_VALVES, _all_entities(hass, ATTR_VALVES), close)
+
+    async def async_open_valves(call):
+        async def open_valve(valve, slot):
+            return await _async_move_valve(valve, VALVE_OPEN, slot)
+
+        if ATTR_ENTITY_ID in call.data:
+            valves = _entities(hass, SERVICE_OPEN_VALVES, call.data[ATTR_ENTITY_ID], 'async_send_valve_command')
+        else:
+            valves = _all_entities(hass, ATTR_VALVES)
+        await async_run_bulk(hass, SERVICE_OPEN_VALVES, valves, open_valve)
+
+    async def async_set_mode_all(call):
+        mode = call.data[ATTR_MODE]
+
+        async def set_mode(mode_sensor, slot):
+            async with slot:
+                await mode_sensor.async_set_mode(mode)
+            return RESULT_OK
+        await async_run_bulk(hass, SERVICE_SET_MODE_ALL, _all_entities(hass, ATTR_MODE_SENSORS), set_mode)
+
+    async def async_set_mode(call):
+        mode = call.data[ATTR_MODE]
+
+        async def set_mode(mode_sensor, slot):
+            async with slot:
+                await mode_sensor.async_set_mode(mode)
+            return RESULT_OK
+        mode_sensors = _entities(hass, SERVICE_SET_MODE, call.data[ATTR_ENTITY_ID], 'async_set_mode')
+        await async_run_bulk(hass, SERVICE_SET_MODE, mode_sensors, set_mode)
+
+    async def async_run_health_test(call):
+        async def run_health_test(valve, slot):
+            async with slot:
+                await valve.async_run_health_test()
+            return RESULT_OK
+        valves = _entities(hass, SERVICE_RUN_HEALTH_TEST, call.data[ATTR_ENTITY_ID], 'async_run_health_test')
+        await async_run_bulk(hass, SERVICE_RUN_HEALTH_TEST, valves, run_health_test)
+
+    async def async_profile(call):
+        schedulers = [flo_data[ATTR_SCHEDULER] for flo_data in _account_data(hass)]
+        if not schedulers:
+            LOG.warning(f"No Flo accounts loaded, ignoring {SERVICE_PROFILE}")
+            return
+
+        try:
+            path, summary = await CycleProfiler(hass, schedulers, call.data[ATTR_CYCLES]).async_run()
+        except ProfileInProgressError as ex:
+            LOG.warning(str(ex))
+            return
+        except asyncio.TimeoutError:
+            LOG.warning(f"Flo {SERVICE_PROFILE} timed out waiting for refresh cycles")
+            return
+
+        hass.components.persistent_notification.async_create(
+            f"{summary}\n\nReport: {path}", title='Flo profile', notification_id=PROFILE_NOTIFICATION_ID)
+
+    hass.services.async_register(FLO_DOMAIN, SERVICE_CLOSE_ALL_VALVES, async_close_all_valves)
+    hass.services.async_register(FLO_DOMAIN, SERVICE_OPEN_VALVES, async_open_valves, SERVICE_OPEN_VALVES_SCHEMA)
+    hass.services.async_register(FLO_DOMAIN, SERVICE_SET_MODE_ALL, async_set_mode_all, SERVICE_SET_MODE_ALL_SCHEMA)
+    hass.services.async_register(FLO_DOMAIN, SERVICE_SET_MODE, async_set_mode, SERVICE_SET_MODE_SCHEMA)
+    hass.services.async_register(
+        FLO_DOMAIN, SERVICE_RUN_HEALTH_TEST, async_run_health_test, SERVICE_RUN_HEALTH_TEST_SCHEMA)
+    hass.services.async_register(FLO_DOMAIN, SERVICE_PROFILE, async_profile, SERVICE_PROFILE_SCHEMA)
@@ -2,90 +2,76 @@
 Support for Flo Water Control System inflow control device valve on/off
 """
 import logging
-import voluptuous as vol
-from datetime import timedelta
+import time
 
 from homeassistant.helpers.entity import ToggleEntity
-from homeassistant.components.sensor import PLATFORM_SCHEMA
-import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.dispatcher import async_dispatcher_connect, async_dispatcher_send
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
-from homeassistant.const import ATTR_ENTITY_ID
-from .const import ICON_VALVE_OPEN, ICON_VALVE_CLOSED
+from .const import ICON_VALVE_OPEN, ICON_VALVE_CLOSED, ATTR_LOCATIONS, ATTR_VALVES, VALVE_OPEN, VALVE_CLOSED
 
+from .coordinator import DATA_CLASS_TELEMETRY, SIGNAL_LEAK_SHUTOFF
 from . import (
     FloDeviceEntity,
     FLO_DOMAIN,
-    FLO_SERVICE,
-    CONF_LOCATION_ID
+    async_get_location
 )
 
 LOG = logging.getLogger(__name__)
 
-# default to 1 minute, don't DDoS Flo servers
-SCAN_INTERVAL = timedelta(seconds=60)
-
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_LOCATION_ID): cv.string
-})
-
-SERVICE_RUN_HEALTH_TEST = 'run_health_test'
-SERVICE_RUN_HEALTH_TEST_SCHEMA = { vol.Required(ATTR_ENTITY_ID): cv.time_period }
-SERVICE_RUN_HEALTH_TEST_SIGNAL = f"{SERVICE_RUN_HEALTH_TEST}_%s"
-
 STATE_OPEN = 'Open'
 STATE_CLOSED = 'Closed'
+STATE_OPENING = 'Opening'
+STATE_CLOSING = 'Closing'
 
-# pylint: disable=unused-argument
-def setup_platform(hass, config, add_switches_callback, discovery_info=None):
-    """Setup the Flo Water Control System integration."""
+# state shown while a valve command has not yet been confirmed by the device
+PENDING_STATES = {
+    VALVE_OPEN: STATE_OPENING,
+    VALVE_CLOSED: STATE_CLOSING
+}
 
-    flo = hass.data[FLO_SERVICE]
-    if flo == None or not flo.is_connected:
-        LOG.warning("No connection to Flo service, ignoring platform setup")
-        return False
+ATTR_PENDING = 'pending'
+ATTR_COMMAND_LATENCY = 'command_latency'
 
-    if discovery_info:
-        location_id = discovery_info[CONF_LOCATION_ID]
-    else:  # manual config
-        location_id = config[CONF_LOCATION_ID]
+ATTR_VALVE_TARGET = 'valve_target'
+ATTR_VALVE_LAST_KNOWN = 'valve_last_known'
 
-    location = flo.location(location_id)
-    if not location:
-        LOG.warning(f"Flo location {location_id} not found, ignoring creation of Flo control valves")
-        return False
+async def async_setup_entry(hass, entry, add_switches_callback):
+    """Setup the Flo water control valves for all locations of a Flo account"""
+    flo_data = hass.data[FLO_DOMAIN][entry.entry_id]
 
     # iterate all devices and create a valve switch for each device
     switches = []
-    for device in location['devices']:
-        valve = FloWaterValve(hass, device['id'])
-        switches.append(valve)
+    for location_id in flo_data[ATTR_LOCATIONS]:
+        location = await async_get_location(flo_data, location_id)
+        if not location:
+            LOG.warning(f"Flo location {location_id} not found, ignoring creation of Flo control valves")
+            continue
 
-    add_switches_callback(switches)
-            
-    # register any exposed services
-    # NOTE: would have used async_register_entity_service if this platform setup was async
+        for device_id in location.device_ids:
+            valve = FloWaterValve(flo_data, device_id)
+            switches.append(valve)
 
-    def run_health_test_handler(call):
-        entity_id = call.data[ATTR_ENTITY_ID]
-        async_dispatcher_send(hass, SERVICE_RUN_HEALTH_TEST_SIGNAL.format(entity_id))
-    hass.services.register(FLO_DOMAIN, SERVICE_RUN_HEALTH_TEST, run_health_test_handler, SERVICE_RUN_HEALTH_TEST_SCHEMA)
+    add_switches_callback(switches)
 
 class FloWaterValve(FloDeviceEntity, ToggleEntity):
     """Flo switch to turn on/off water flow."""
 
-    def __init__(self, hass, device_id):
-        super().__init__(hass, 'Water Valve', device_id)
+    DATA_CLASSES = (DATA_CLASS_TELEMETRY,)
+    SOURCE_FIELDS = (('valve_target',), ('valve_last_known',))
+
+    def __init__(self, flo_data, device_id):
+        super().__init__(flo_data, 'Water Valve', device_id)
+        self._pending = None  # valve target of a command not yet confirmed by the device
 
         state = self.device_state
         if state:
-            self.update()
+            self.update_from_cache()
  
     @property
     def icon(self):
         if self.state == STATE_OPEN:
             return ICON_VALVE_OPEN
-        elif self.state == STATE_CLOSED:
+        elif self.state in (STATE_CLOSED, STATE_CLOSING):
             return ICON_VALVE_CLOSED
         else:
             return ICON_VALVE_OPEN
@@ -93,10 +79,10 @@ class FloWaterValve(FloDeviceEntity, ToggleEntity):
     @property
     def is_on(self):
         """Return true if Flo control valve TARGET is set to open (even if valve has not closed entirely yet)."""
-        valve = self.device_state.get('valve')
-        if valve:
+        device = self.device_state
+        if device:
             # if target is set to turn on, then return True that the device is on (even if last known is not on)
-            target = valve.get('target')
+            target = device.valve_target
             if target:
                 if target == 'open':
                     return True
@@ -104,7 +90,7 @@ class FloWaterValve(FloDeviceEntity, ToggleEntity):
                     return False
 
             # if missing target, fallback to the last known state
-            lastKnown = valve.get('lastKnown')
+            lastKnown = device.valve_last_known
             if lastKnown:
                 if lastKnown == 'open':
                     return True
@@ -113,68 +99,90 @@ class FloWaterValve(FloDeviceEntity, ToggleEntity):
 
             return None
 
-    def turn_on(self):
-        self.flo_service.open_valve(self._device_id)
+    async def async_turn_on(self, **kwargs):
+        return await self.async_command_valve(VALVE_OPEN)
 
-         # Flo device's valve adjustments are NOT instanenous, so update state to indiciate that it WILL be on (eventually)
-        self.update_state(STATE_OPEN)
+    async def async_turn_off(self, **kwargs):
+        return await self.async_command_valve(VALVE_CLOSED)
 
-        # trigger update coordinator to read latest state from service
-        self.schedule_update_ha_state(force_refresh=True)
+    async def async_command_valve(self, target):
+        """Move the valve, then poll the device until it confirms, returning True once confirmed.
 
-    def turn_off(self):
-        self.flo_service.close_valve(self._device_id)
+        Returns False if the device did not confirm before the timeout, or None if superseded.
+        """
+        started = await self.async_send_valve_command(target)
+        return await self.async_confirm_valve_command(target, started)
 
-        # Flo device's valve adjustments are NOT instanenous, so update state to indiciate that it WILL be off (eventually)
-        self.update_state(STATE_CLOSED)
+    async def async_send_valve_command(self, target):
+        """Send the valve command and show the move as pending, returning the monotonic time it was sent"""
+        started = time.monotonic()
+        if target == VALVE_OPEN:
+            await self.flo_service.async_open_valve(self._device_id)
+        else:
+            await self.flo_service.async_close_valve(self._device_id)
+
+        # Flo device's valve adjustments are NOT instanenous, so show the move as pending until confirmed
+        self._pending = target
+        self._attrs[ATTR_PENDING] = True
+        self.update_state(PENDING_STATES[target])
+        self.async_write_ha_state()
+        return started
+
+    async def async_confirm_valve_command(self, target, started):
+        """Poll the device until it confirms the command sent at started (see async_command_valve)"""
+        confirmed = await self.scheduler.async_confirm_valve(self._device_id, target)
+        if confirmed is None:
+            return None  # a newer command is being confirmed
+
+        self._pending = None
+        self._attrs[ATTR_PENDING] = False
+        if confirmed:
+            self._attrs[ATTR_COMMAND_LATENCY] = round(time.monotonic() - started, 1)
+            LOG.info(f"Flo valve {self._device_id} confirmed {target} after {self._attrs[ATTR_COMMAND_LATENCY]}s")
+        else:
+            LOG.warning(f"Flo valve {self._device_id} did not confirm {target}, resuming normal polling")
 
-        # trigger update coordinator to read latest state from service
-        self.schedule_update_ha_state(force_refresh=True)
+        self.update_from_cache()
+        self.async_write_ha_state()
+        return confirmed
 
-    def run_health_test(self):
+    async def async_run_health_test(self):
         """Run a health test."""
-        self.flo_service.run_health_test(self._device_id)
+        await self.flo_service.async_run_health_test(self._device_id)
 
     async def async_added_to_hass(self):
         """Run when entity is about to be added to hass."""
-        super().async_added_to_hass()
+        await super().async_added_to_hass()
+
+        # valves of all accounts can be commanded at once by the bulk services
+        self._flo_data[ATTR_VALVES][self._device_id] = self
+        self.async_on_remove(lambda: self._flo_data[ATTR_VALVES].pop(self._device_id, None))
 
-        # register the trigger to handle run_health_test service call
-        async_dispatcher_connect(
-            self._hass,
-            SERVICE_RUN_HEALTH_TEST_SIGNAL.format(self.entity_id),
-            self.run_health_test
+        # optionally shut off the water when a leak is detected locally
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_LEAK_SHUTOFF.format(self._device_id), self.async_turn_off)
         )
 
     def update_attributes(self):
         """Update various attributes about the valve"""
-        valve = self.device_state.get('valve')
-        if valve:
-            self._attrs['valve'] = valve
-            LOG.debug(f"WOW: {self.device_state}")
-            #self._attrs['nickname'] = self.device_state.get['nickname']
-
-            #fwProperties = self.device_state.get('fwProperties')
-            #if fwProperties:
-            #    self._attrs['valve_actuation_count'] = fwProperties.get('valve_actuation_count')
-
-            #healthTest = self.device_state.get('healthTest')
-            #if healthTest:
-            #    self._attrs['healthTest'] = healthTest.get('config')
+        self._attrs[ATTR_VALVE_TARGET] = self.device_state.valve_target
+        self._attrs[ATTR_VALVE_LAST_KNOWN] = self.device_state.valve_last_known
 
-            #self._attrs['lastHeardFromTime'] = self.device_state.get('lastHeardFromTime')
-
-    def update(self):
+    def update_from_cache(self):
         if not self.device_state:
             return
 
-        valve = self.device_state.get('valve')
-        if valve:
-            target = valve.get('target')
-            lastKnown = valve.get('lastKnown')
-
+        target = self.device_state.valve_target
+        lastKnown = self.device_state.valve_last_known
+        if target or lastKnown:
             self.update_attributes()
 
+            # keep showing the pending move until the device confirms it
+            if self._pending and lastKnown != self._pending:
+                self.update_state(PENDING_STATES[self._pending])
+                return
+
             # determine if the valve is open or closed
             is_open = None
             if lastKnown:
@@ -0,0 +1,155 @@
+"""
+Rolling window of recent telemetry samples for a Flo device.
+
+Samples are kept in fixed-size arrays used as a ring buffer, alongside running
+sums and monotonic min/max queues, so adding a sample and reading the window
+statistics are O(1) (amortized) regardless of the window length.
+"""
+import math
+from array import array
+from collections import deque
+
+FIELD_GPM = 'gpm'
+FIELD_PSI = 'psi'
+FIELD_TEMP_F = 'temp_f'
+FIELDS = (FIELD_GPM, FIELD_PSI, FIELD_TEMP_F)
+
+DEFAULT_WINDOW = 3600  # seconds
+DEFAULT_CAPACITY = 720  # samples (a 1 hour window polled every 5s)
+MAX_CAPACITY = 8640  # samples, bounds memory for long windows with fast polling
+
+# Flo reports bogus very high temperatures since deprecating its water temperature reading
+MAX_VALID_TEMP_F = 140
+
+STAT_MEAN = 'mean'
+STAT_MIN = 'min'
+STAT_MAX = 'max'
+STAT_STDDEV = 'stddev'
+
+
+class _FieldWindow:
+    """Running statistics for the values of one field currently in the window"""
+
+    __slots__ = ('count', 'sum', 'sum_squares', 'min_queue', 'max_queue')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        # sequence numbers of candidate min/max samples, with monotonic values
+        self.min_queue = deque()
+        self.max_queue = deque()
+
+    def add(self, seq, value, values):
+        self.count += 1
+        self.sum += value
+        self.sum_squares += value * value
+
+        while self.min_queue and values(self.min_queue[-1]) >= value:
+            self.min_queue.pop()
+        self.min_queue.append(seq)
+        while self.max_queue and values(self.max_queue[-1]) <= value:
+            self.max_queue.pop()
+        self.max_queue.append(seq)
+
+    def remove(self, seq, value):
+        self.count -= 1
+        self.sum -= value
+        self.sum_squares -= value * value
+        if self.min_queue and self.min_queue[0] == seq:
+            self.min_queue.popleft()
+        if self.max_queue and self.max_queue[0] == seq:
+            self.max_queue.popleft()
+        if not self.count:
+            # reset accumulated float error whenever the window empties
+            self.sum = self.sum_squares = 0.0
+
+
+class TelemetryBuffer:
+    """Ring buffer of (timestamp, gpm, psi, temp_f) samples within a time window"""
+
+    def __init__(self, window=DEFAULT_WINDOW, capacity=DEFAULT_CAPACITY, flow_threshold=0.0):
+        self.window = window
+        self.capacity = capacity
+        self.flow_threshold = flow_threshold  # gpm above which time is counted as flowing
+
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._values = {field: array('d', bytes(8 * capacity)) for field in FIELDS}
+        self._present = {field: array('b', bytes(capacity)) for field in FIELDS}  # missing values are skipped
+
+        self._first = 0  # sequence number of the oldest sample
+        self._next = 0  # sequence number of the next sample
+        self._windows = {field: _FieldWindow() for field in FIELDS}
+
+        # seconds spent above the flow threshold between consecutive samples in the window
+        self._flowing_seconds = 0.0
+
+    def __len__(self):
+        return self._next - self._first
+
+    def _value(self, field):
+        values = self._values[field]
+        capacity = self.capacity
+        return lambda seq: values[seq % capacity]
+
+    def _flowing_interval(self, seq):
+        """Seconds between sample seq and the next one, if flow at seq was above the threshold"""
+        index = seq % self.capacity
+        if not self._present[FIELD_GPM][index] or self._values[FIELD_GPM][index] <= self.flow_threshold:
+            return 0.0
+        return self._timestamps[(seq + 1) % self.capacity] - self._timestamps[index]
+
+    def _evict(self):
+        seq = self._first
+        if seq + 1 < self._next:
+            self._flowing_seconds -= self._flowing_interval(seq)
+
+        index = seq % self.capacity
+        for field in FIELDS:
+            if self._present[field][index]:
+                self._windows[field].remove(seq, self._values[field][index])
+        self._first += 1
+
+    def add(self, timestamp, gpm=None, psi=None, temp_f=None):
+        """Append a sample, evicting samples that fell out of the window (or the buffer)"""
+        if len(self) and timestamp <= self._timestamps[(self._next - 1) % self.capacity]:
+            return  # out of order or duplicate sample
+
+        while len(self) and (len(self) >= self.capacity or
+                             self._timestamps[self._first % self.capacity] <= timestamp - self.window):
+            self._evict()
+
+        seq = self._next
+        index = seq % self.capacity
+        self._timestamps[index] = timestamp
+        for field, value in zip(FIELDS, (gpm, psi, temp_f)):
+            present = value is not None
+            self._present[field][index] = present
+            if present:
+                self._values[field][index] = value
+                self._windows[field].add(seq, value, self._value(field))
+        self._next += 1
+
+        if len(self) > 1:
+            self._flowing_seconds += self._flowing_interval(seq - 1)
+
+    def stats(self, field):
+        """Return the mean, min, max and stddev of a field over the window (None if no samples)"""
+        window = self._windows[field]
+        if not window.count:
+            return None
+
+        value = self._value(field)
+        mean = window.sum / window.count
+        variance = max(0.0, window.sum_squares / window.count - mean * mean)
+        return {
+            STAT_MEAN: mean,
+            STAT_MIN: value(window.min_queue[0]),
+            STAT_MAX: value(window.max_queue[0]),
+            STAT_STDDEV: math.sqrt(variance)
+        }
+
+    @property
+    def flowing_seconds(self):
+        """Seconds within the window that flow was above the flow threshold"""
+        return max(0.0, self._flowing_seconds)